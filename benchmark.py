@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import argparse, copy, csv, os, re, subprocess, sys, tempfile, time
+
+import generate
+import schedule
+
+# Runs schedule.py on generated inputs of different sizes, with different numbers of processes and
+# search modes, and reports how fast and how well it did. Each run is its own process so the peak
+# memory is only that run's.
+
+# runs schedule.main in a child and reports the peak memory of it and its workers (in KiB on linux)
+WRAPPER = '''
+import multiprocessing, resource, sys
+sys.argv = sys.argv[1:]
+sys.path.insert(0, sys.argv.pop(1))
+import schedule
+schedule.main()
+multiprocessing.active_children()
+print("peak_kib: %d" % max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss), file=sys.stderr)
+'''
+
+RUNS = re.compile(r'\[WARNING/[^\]]*\] (Optimize )?runs: (\d+) in ([\d.]+) seconds')
+PEAK = re.compile(r'^peak_kib: (\d+)$', re.MULTILINE)
+
+COLUMNS = ['families', 'nights', 'processes', 'host_search', 'guest_search', 'seconds',
+           'host_runs_per_second', 'guest_runs_per_second', 'score_host', 'score_guest',
+           'starved', 'peak_mib']
+
+# runs one benchmark and returns its row
+def run(args, input_file, output_file, processes, host_search, guest_search):
+    command = [sys.executable, '-c', WRAPPER, 'schedule.py', os.path.dirname(os.path.abspath(__file__)),
+               input_file, output_file, '-p', str(processes), '-t', str(args.time),
+               '-s', str(args.max_dinner_size), '-a', host_search, '-g', guest_search]
+    command += args.schedule_args
+    start = time.time()
+    result = subprocess.run(command, capture_output=True, text=True)
+    seconds = time.time() - start
+    if 0 != result.returncode:
+        sys.stderr.write(result.stderr)
+        raise RuntimeError('schedule.py failed on %s' % input_file)
+
+    # runs are added up over the workers, each worker ran for about the same time
+    host_runs = guest_runs = host_time = guest_time = 0
+    for optimize, runs, took in RUNS.findall(result.stderr):
+        if optimize:
+            guest_runs += int(runs)
+            guest_time = max(guest_time, float(took))
+        else:
+            host_runs += int(runs)
+            host_time = max(host_time, float(took))
+    peak = PEAK.search(result.stderr)
+
+    roster = schedule.Roster(schedule.read_csv(input_file, args.max_dinner_size))
+    result_schedule = schedule.read_schedule(output_file, roster)
+    return {
+        'families': roster.count,
+        'nights': roster.nights,
+        'processes': processes,
+        'host_search': host_search,
+        'guest_search': guest_search,
+        'seconds': round(seconds, 3),
+        'host_runs_per_second': round(host_runs/max(host_time, 1e-9), 1),
+        'guest_runs_per_second': round(guest_runs/max(guest_time, 1e-9), 1),
+        'score_host': round(schedule.score_host(roster, result_schedule), 3),
+        'score_guest': round(schedule.score_guest(roster, result_schedule), 3),
+        'starved': schedule.starved_meals(roster, result_schedule),
+        'peak_mib': round(int(peak.group(1))/1024, 1) if peak else None,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmarks schedule.py on generated Salt shaker dinners',
+            epilog='Arguments after -- are passed on to schedule.py'
+            )
+    generate.add_instance_arguments(parser)
+    parser.add_argument("--scales", default=[50, 200, 1000], type=int, nargs='+',
+                        help="The numbers of families to benchmark, replaces --families")
+    parser.add_argument("--process_counts", default=[1], type=int, nargs='+',
+                        help="The numbers of processes to benchmark")
+    parser.add_argument("--host_searches", default=['restart'], nargs='+', choices=['restart', 'anneal', 'sample'],
+                        help="The host searches to benchmark")
+    parser.add_argument("--guest_searches", default=['local'], nargs='+', choices=['local', 'restart', 'exact'],
+                        help="The guest searches to benchmark")
+    parser.add_argument("-t", "--time", default=10, type=float, help="The --time for each run of schedule.py")
+    parser.add_argument("-s", "--max_dinner_size", default=8, type=int, help="The --max_dinner_size for schedule.py")
+    parser.add_argument("-o", "--output", help="Also write the results to this CSV")
+    parser.add_argument("schedule_args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.schedule_args and '--' == args.schedule_args[0]:
+        args.schedule_args = args.schedule_args[1:]
+
+    rows = []
+    print(' '.join('%s' % column for column in COLUMNS))
+    with tempfile.TemporaryDirectory() as directory:
+        for families in args.scales:
+            instance = copy.copy(args)
+            instance.families = families
+            input_file = os.path.join(directory, 'in_%d.csv' % families)
+            output_file = os.path.join(directory, 'out_%d.csv' % families)
+            generate.write_input(input_file, instance)
+            for processes in args.process_counts:
+                for host_search in args.host_searches:
+                    for guest_search in args.guest_searches:
+                        row = run(args, input_file, output_file, processes, host_search, guest_search)
+                        rows.append(row)
+                        print(' '.join(str(row[column]) for column in COLUMNS), flush=True)
+
+    if None != args.output:
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import argparse, csv, random, sys
+
+# Makes up an input CSV in the format read by schedule.py's read_csv so the scheduler can be tried on
+# more families and nights than the examples have. Everything comes from one seeded random so the
+# same arguments always make the same file.
+
+# the header read_csv skips, nights are named like the examples
+def header(nights):
+    return (['Email Address', 'Size', 'Space', 'host_target', 'allergies', 'allergens', 'knows', 'repels'] +
+            ['Night %d' % (night + 1) for night in range(nights)])
+
+# makes the rows for the families, not including the header
+def generate_rows(args):
+    rng = random.Random(args.seed)
+    allergy_tags = ['allergy%d' % a for a in range(args.allergy_tags)]
+
+    # families that know each other are put in clusters, each one with its own tag
+    clusters = max(1, args.families // max(1, args.cluster_size))
+
+    rows = []
+    for family in range(args.families):
+        size = rng.choice(args.sizes)
+        host = rng.random() < args.hosts
+        space = max(size, rng.choice(args.spaces)) if host else 0
+        host_target = ''
+        if host and rng.random() < args.host_targets:
+            host_target = str(rng.randint(1, max(1, args.nights // 3)))
+
+        # a family is allergic to and has each allergen at random, but only hosts have allergens
+        allergies = [tag for tag in allergy_tags if rng.random() < args.allergies]
+        allergens = [tag for tag in allergy_tags if host and rng.random() < args.allergens]
+
+        knows = []
+        if rng.random() < args.knows:
+            knows.append('cluster%d' % rng.randrange(clusters))
+
+        nights = []
+        for night in range(args.nights):
+            if rng.random() >= args.attend:
+                nights.append('Cannot Attend')
+            elif host and rng.random() < args.host_nights:
+                nights.append('Can Host')
+            else:
+                nights.append('Can Attend')
+
+        rows.append(['family%d@example.com' % family, size, space, host_target, allergies, allergens,
+                     knows, [], nights])
+
+    # each repel pair is two families sharing a tag so they are never at the same dinner
+    for pair in range(min(args.repels, args.families // 2)):
+        a, b = rng.sample(range(args.families), 2)
+        rows[a][7].append('repel%d' % pair)
+        rows[b][7].append('repel%d' % pair)
+
+    return [row[:4] + [' '.join(tags) for tags in row[4:8]] + row[8] for row in rows]
+
+# writes a generated input CSV to filename, or stdout for '-'
+def write_input(filename, args):
+    file = sys.stdout if '-' == filename else open(filename, 'w', newline='')
+    try:
+        writer = csv.writer(file)
+        writer.writerow(header(args.nights))
+        writer.writerows(generate_rows(args))
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+# adds the arguments describing an instance, shared with benchmark.py
+def add_instance_arguments(parser):
+    parser.add_argument("-n", "--families", default=100, type=int, help="The number of families")
+    parser.add_argument("-k", "--nights", default=8, type=int, help="The number of nights")
+    parser.add_argument("--seed", default=0, type=int, help="The seed for the random generator")
+    parser.add_argument("--sizes", default=[1, 2, 2, 2, 3, 4], type=int, nargs='+',
+                        help="Family sizes to pick from, repeat a size to make it more likely")
+    parser.add_argument("--spaces", default=[6, 8, 8, 10], type=int, nargs='+',
+                        help="Host spaces to pick from, repeat a space to make it more likely")
+    parser.add_argument("--hosts", default=0.5, type=float, help="The chance a family can host")
+    parser.add_argument("--host_targets", default=0.2, type=float, help="The chance a host has a host_target")
+    parser.add_argument("--attend", default=0.85, type=float, help="The chance a family can attend a night")
+    parser.add_argument("--host_nights", default=0.75, type=float,
+                        help="The chance a host can host a night they can attend")
+    parser.add_argument("--allergy_tags", default=2, type=int, help="The number of distinct allergies")
+    parser.add_argument("--allergies", default=0.15, type=float,
+                        help="The chance a family has each allergy")
+    parser.add_argument("--allergens", default=0.3, type=float,
+                        help="The chance a host has each allergen")
+    parser.add_argument("--knows", default=0.5, type=float,
+                        help="The chance a family is in a cluster of families that know each other")
+    parser.add_argument("--cluster_size", default=5, type=int,
+                        help="The average number of families in a knows cluster")
+    parser.add_argument("--repels", default=5, type=int, help="The number of pairs of families that repel")
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Generates an input CSV for Salt shaker dinners'
+            )
+    parser.add_argument("output", nargs='?', default='-', help="Where to write the CSV, stdout by default")
+    add_instance_arguments(parser)
+    args = parser.parse_args()
+
+    write_input(args.output, args)
+
+if __name__ == "__main__":
+    main()
@@ -11,13 +11,17 @@
 # General Public License for more details.
 #
 # You should have received a copy of the GNU General Public License along with saltshaker. If not,
-# see <https://www.gnu.org/licenses/>. 
+# see <https://www.gnu.org/licenses/>.
 
 
 # This is the scheduler the saltshaer project. It takes an input file as shown in examples/in and
 # produces an output file like in examples/out.
+#
+# Internally families are refered to by their index (see Roster) and a schedule is a list with a
+# dictonary for each night, keyed by the host's index with a list of the attendees' indexes
+# (starting with the host) as the value. expand_schedule turns one back into Family objects.
 
-import argparse, csv, logging, math, multiprocessing, os, sys, random, time
+import argparse, array, copy, cProfile, csv, glob, hashlib, itertools, json, logging, math, multiprocessing, operator, os, pickle, sys, random, time
 
 
 # The class family is basically just a row from the input file.
@@ -33,6 +37,9 @@ import argparse, csv, logging, math, multiprocessing, os, sys, random, time
 # repel: Who the family should never share a dinner with
 # attend_nights: The nights the family can attend
 # host_nights: The nights the family can host
+#
+# Once compacted the family also has an index and the _bits members which are the bit versions of
+# the tag sets and nights used by Roster.
 class Family:
     def __init__(self, email, size, space, host_target, allergies, allergens, knows, repel,
                  attend_nights, host_nights, nights_count):
@@ -61,9 +68,195 @@ class Family:
     def __hash__(self):
         return hash(self.email)
 
+    # gives the family its index and turns its tags and nights into bits
+    def compact(self, index, tags):
+        self.index = index
+        self.allergy_bits = intern_tags(tags, self.allergies)
+        self.allergen_bits = intern_tags(tags, self.allergens)
+        self.knows_bits = intern_tags(tags, self.knows)
+        self.repel_bits = intern_tags(tags, self.repel)
+        self.attend_bits = sum(1 << night for night, attend in enumerate(self.attend_nights) if attend)
+        self.host_bits = sum(1 << night for night, host in enumerate(self.host_nights) if host)
+
+# turns a set of tags into an int with a bit for each tag, tags is a dictonary keyed by every tag
+# seen so far with the value of its bit
+def intern_tags(tags, names):
+    bits = 0
+    for name in names:
+        if name not in tags:
+            tags[name] = 1 << len(tags)
+        bits |= tags[name]
+    return bits
+
+# A compact copy of the families for the search loops.
+#
+# Families are refered to by their index and each member here is a list indexed by it, so the
+# search loops never have to hash a Family. Allergies, allergens, knows and repel are ints with a
+# bit for each tag so checking them is a single &, and attend and host are ints with a bit for each
+# night. Being just lists of ints it is cheap to copy and pickle.
+#
+# As none of it changes during a run the pair checks are also worked out once here, each as a row
+# of bits indexed by family: compatible (the hosts a guest is not allergic to), conflicts (the
+# families a family repels) and strangers (the families a family has no knows in common with, which
+# are the only meets that score).
+#
+# A roster of the same families with only their sizes, spaces or host targets changed (see sweep.py)
+# can take those from a base roster instead of working them out again.
+class Roster:
+    def __init__(self, families, base=None):
+        self.families = families
+        self.count = len(families)
+        self.nights = len(families[0].attend_nights)
+
+        self.size = [f.size for f in families]
+        self.space = [f.space for f in families]
+        self.host_target = [f.host_target for f in families]
+        self.nights_count = [f.nights_count for f in families]
+        self.allergies = [f.allergy_bits for f in families]
+        self.allergens = [f.allergen_bits for f in families]
+        self.knows = [f.knows_bits for f in families]
+        self.repel = [f.repel_bits for f in families]
+        self.attend = [f.attend_bits for f in families]
+        self.host = [f.host_bits for f in families]
+
+        # the families attending and the families that can host each night
+        if None != base:
+            self.attendees = base.attendees
+            self.can_host = base.can_host
+        else:
+            self.attendees = [[f.index for f in families if f.attend_nights[night]]
+                              for night in range(self.nights)]
+            self.can_host = [[f.index for f in families if f.host_nights[night]]
+                             for night in range(self.nights)]
+
+        # when warm starting (see warm_start) the dinners of the nights that can't change, the
+        # nights the input changed, the schedule the searches start from, where each family sat in
+        # it and how much each change from it costs, otherwise every night is free
+        self.fixed = [None]*self.nights
+        self.free_nights = list(range(self.nights))
+        self.changed_nights = list(range(self.nights))
+        self.previous = None
+        self.previous_seats = None
+        self.churn = 0
+
+        # what generate_host_schedule needs each night that is the same for every schedule: the
+        # seats needed by each set of allergies (most restrictive first), the free seats of the
+        # hosts without a target, the hosts with a target and for each set of allergies the hosts
+        # with a target that can feed it, in the order they are tried
+        self.demands = []
+        self.free_seats = []
+        self.target_hosts = []
+        self.priority_hosts = []
+        for night in range(self.nights):
+            demand = {}
+            for family in self.attendees[night]:
+                demand[self.allergies[family]] = demand.get(self.allergies[family], 0) + self.size[family]
+            hosts = [family for family in self.attendees[night] if self.host[family] >> night & 1]
+            priority = [family for family in hosts if None != self.host_target[family]]
+            self.demands.append(dict(sorted(demand.items(), key=lambda d: (d[0].bit_count(), d[0]),
+                                            reverse=True)))
+            self.free_seats.append({family: self.space[family] - self.size[family]
+                                    for family in hosts if None == self.host_target[family]})
+            self.target_hosts.append(priority)
+            self.priority_hosts.append({allergy: [family for family in priority
+                                                  if not allergy & self.allergens[family]]
+                                        for allergy in demand})
+
+        # where each family sits in a lane for score_host_batch, lanes are made of 64 bit segments
+        # and the families whose host ratio is scored come first with a segment to each 64 (or
+        # fewer) with the same nights_count, lane_groups holds the nights_count of those segments
+        self.lane_bit = [0]*self.count
+        self.lane_groups = []
+        ratio_families = sorted((f for f in families if None == f.host_target),
+                                key=lambda f: f.nights_count)
+        for position, f in enumerate(ratio_families):
+            if 0 == position % 64 or f.nights_count != ratio_families[position-1].nights_count:
+                self.lane_groups.append(f.nights_count)
+            self.lane_bit[f.index] = 1 << (64*(len(self.lane_groups) - 1) + position % 64)
+        others = [f for f in families if None != f.host_target]
+        for position, f in enumerate(others):
+            self.lane_bit[f.index] = 1 << (64*len(self.lane_groups) + position)
+        self.lane_segments = len(self.lane_groups) + (len(others) + 63) // 64
+
+        # families share rows with every other family with the same tags, so work out each distinct
+        # set of tags once against the families holding each distinct set of tags
+        if None != base:
+            self.compatible = base.compatible
+            self.conflicts = base.conflicts
+            self.strangers = base.strangers
+            return
+        allergens = group_families(self.allergens)
+        repels = group_families(self.repel)
+        knows = group_families(self.knows)
+        self.compatible = [pair_row(allergens, lambda other: not allergy & other)
+                           for allergy in self.allergies]
+        self.conflicts = [pair_row(repels, lambda other: repel & other) for repel in self.repel]
+        self.strangers = [pair_row(knows, lambda other: not know & other) for know in self.knows]
+
+    # Starts from a previous schedule (see read_schedule) instead of a blank one. The first frozen
+    # nights have been published so their dinners are kept as they were, with the families at them
+    # taken as that night's attendees. The other nights are cleaned up to the current input (hosts
+    # that can no longer host are dropped, as are guests that can no longer attend) and seed both
+    # searches, which take churn off the score for every host and seat that is not as it was. A
+    # night the input changed is one where families joined or left or a dinner no longer works,
+    # only those nights are generated again (see generate_host_schedule).
+    def warm_start(self, previous, frozen, churn):
+        self.previous = []
+        changed_nights = []
+        self.previous_seats = [[None]*self.count for _ in range(self.nights)]
+        for night, dinners in enumerate(previous):
+            if night < frozen:
+                self.fixed[night] = dinners
+                self.attendees[night] = sorted(f for attendees in dinners.values() for f in attendees)
+                self.previous.append(dinners)
+                continue
+            cleaned = {}
+            for host, attendees in dinners.items():
+                if self.host[host] >> night & 1:
+                    cleaned[host] = [host] + [a for a in attendees[1:] if self.attend[a] >> night & 1]
+            for host, attendees in dinners.items():
+                for family in attendees:
+                    if family != host:
+                        self.previous_seats[night][family] = host
+            self.previous.append(cleaned)
+
+            changed = len(cleaned) != len(dinners) or \
+                    {f for attendees in dinners.values() for f in attendees} != set(self.attendees[night])
+            for host, attendees in cleaned.items():
+                people = 0
+                members = 0
+                for family in attendees:
+                    if family != host and not self.compatible[family] >> host & 1 or self.conflicts[family] & members:
+                        changed = True
+                    people += self.size[family]
+                    members |= 1 << family
+                if self.space[host] < people:
+                    changed = True
+            if changed:
+                changed_nights.append(night)
+        self.free_nights = [night for night in range(self.nights) if None == self.fixed[night]]
+        self.changed_nights = changed_nights
+        self.churn = churn
+
+# returns a dictonary keyed by each distinct value with the bits of the families that have it
+def group_families(values):
+    groups = {}
+    for family, value in enumerate(values):
+        groups[value] = groups.get(value, 0) | 1 << family
+    return groups
+
+# the bits of every family in groups whose value passes test
+def pair_row(groups, test):
+    row = 0
+    for value, families in groups.items():
+        if test(value):
+            row |= families
+    return row
+
 # Reads a csv file in and populates a list of families
 def read_csv(filename, max_dinner_size):
     families = []
+    tags = {}
     with open(filename, 'r') as file:
         #reader = csv.DictReader(csvfile)
 
@@ -88,11 +281,53 @@ def read_csv(filename, max_dinner_size):
 
             nights_count = sum(attend_nights)
 
-            families.append(Family(email, size, space, host_target, allergies, allergens, knows,
-                                   repel, attend_nights, host_nights, nights_count))
+            family = Family(email, size, space, host_target, allergies, allergens, knows, repel,
+                            attend_nights, host_nights, nights_count)
+            family.compact(len(families), tags)
+            families.append(family)
 
     return families
 
+# turns a schedule of indexes back into a schedule of families
+def expand_schedule(families, schedule):
+    return [{families[host]: {families[a] for a in attendees} for host, attendees in hosts.items()}
+            for hosts in schedule]
+
+# Packs a schedule into a flat array of ints for sending between processes, which pickles to a
+# fraction of the size of the dictonaries. It holds the number of nights then for each night the
+# number of dinners, and for each dinner the number of attendees followed by them (host first).
+# The ints are 16 bit unless there are too many families for that.
+def pack_schedule(schedule):
+    values = [len(schedule)]
+    for hosts in schedule:
+        values.append(len(hosts))
+        for attendees in hosts.values():
+            values.append(len(attendees))
+            values.extend(attendees)
+    try:
+        return array.array('H', values)
+    except OverflowError:
+        return array.array('l', values)
+
+# the most ints a packed schedule for roster can take
+def packed_size(roster):
+    return 1 + roster.nights*(1 + 2*roster.count)
+
+# turns a packed schedule back into a schedule
+def unpack_schedule(packed):
+    schedule = []
+    position = 1
+    for _ in range(packed[0]):
+        hosts = {}
+        dinners = packed[position]
+        position += 1
+        for _ in range(dinners):
+            count = packed[position]
+            hosts[packed[position + 1]] = list(packed[position + 1:position + 1 + count])
+            position += 1 + count
+        schedule.append(hosts)
+    return schedule
+
 # writes the result CSV out
 def write_csv(filename, schedule):
     with open(filename, 'w', newline='') as file:
@@ -111,8 +346,44 @@ def write_csv(filename, schedule):
                         ', '.join(attendees_email)
                         ])
 
+# reads a result CSV written by write_csv back into a schedule of indexes for the families in roster,
+# families that are no longer in the roster are left out along with the dinners they hosted
+def read_schedule(filename, roster):
+    log = multiprocessing.get_logger()
+    index = {f.email: f.index for f in roster.families}
+    schedule = [{} for _ in range(roster.nights)]
+    with open(filename, 'r') as file:
+        reader = csv.reader(file)
+        next(reader)  # Skip header
+        for row in reader:
+            if row[3] not in index:
+                log.warning(row[3] + " is no longer a family, dropping their dinner on night # " + row[0])
+                continue
+            host = index[row[3]]
+            attendees = [index[email] for email in row[4].split(', ') if email != row[3] and email in index]
+            schedule[int(row[0])][host] = [host] + attendees
+    return schedule
+
+# writes the --metrics records out, as CSV if the filename ends in .csv (with the timings and
+# trajectory as JSON) and JSON Lines otherwise
+def write_metrics(filename, records):
+    with open(filename, 'w', newline='') as file:
+        if not filename.endswith('.csv'):
+            for record in records:
+                file.write(json.dumps(record) + '\n')
+            return
+
+        columns = []
+        for record in records:
+            columns += [column for column in record if column not in columns]
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([json.dumps(record[column]) if isinstance(record.get(column), (dict, list))
+                             else record.get(column) for column in columns])
+
 # writes a summery of the score of the finding
-def summery(schedule):
+def summery(roster, schedule):
 
     log = multiprocessing.get_logger()
 
@@ -141,11 +412,11 @@ def summery(schedule):
     log.info("max_hosts: " + str(max_hosts))
     hcstring = "Host Counts: "
     for host in host_counts:
-        hcstring += str(host.email) + ": " + str(host_counts[host]) + ", "
+        hcstring += str(roster.families[host].email) + ": " + str(host_counts[host]) + ", "
     log.info(hcstring)
     log.info("meets_count: " + str(meets_count))
 
-def host_summery(schedule):
+def host_summery(roster, schedule):
 
     log = multiprocessing.get_logger()
 
@@ -157,7 +428,7 @@ def host_summery(schedule):
     for night in range(len(schedule)):
         for host in schedule[night]:
             # calculate ratios for hosts that don't ask to host an exact number of meals
-            if None == host.host_target:
+            if None == roster.host_target[host]:
                 host_counts[host] = host_counts.get(host, 0) + 1
             # penlize repeat dinners
             if 0 < night and host in schedule[night-1]:
@@ -166,10 +437,10 @@ def host_summery(schedule):
     # the ratio of meals each host does
     host_ratios = {}
     for host in host_counts:
-        host_ratios[host] = host_counts[host]/host.nights_count
+        host_ratios[host] = host_counts[host]/roster.nights_count[host]
 
-    host_ratio_average = sum(host_ratios.values())/len(host_ratios)
-    host_ratio_max = max(host_ratios.values())
+    host_ratio_average = sum(host_ratios.values())/max(1, len(host_ratios))
+    host_ratio_max = max(host_ratios.values(), default=0)
 
     # penlized difference from ratiots
     for ratio in host_ratios.values():
@@ -180,11 +451,11 @@ def host_summery(schedule):
     log.info("max_ratio: " + str(host_ratio_max))
     hrstring = "Host Ratios: "
     for host in host_ratios:
-        hrstring += str(host.email) + ": " + str(host_ratios[host]) + ", "
+        hrstring += str(roster.families[host].email) + ": " + str(host_ratios[host]) + ", "
     log.info(hrstring)
 
 # Calculates a score for the result
-def score_host(schedule):
+def score_host(roster, schedule):
     score = 0
 
     # this will be a dictonary keyed by a family and with a value of the number of times they host
@@ -195,7 +466,7 @@ def score_host(schedule):
         score -= 2*len(schedule[night])
         for host in schedule[night]:
             # calculate ratios for hosts that don't ask to host an exact number of meals
-            if None == host.host_target:
+            if None == roster.host_target[host]:
                 host_counts[host] = host_counts.get(host, 0) + 1
             # small penility for repeat dinners
             if 0 < night and host in schedule[night-1]:
@@ -205,9 +476,10 @@ def score_host(schedule):
     # the ratio of meals each host does
     host_ratios = {}
     for host in host_counts:
-        host_ratios[host] = host_counts[host]/host.nights_count
+        host_ratios[host] = host_counts[host]/roster.nights_count[host]
 
-    host_ratio_average = sum(host_ratios.values())/len(host_ratios)
+    # (when every host has a target there are no ratios to penilize)
+    host_ratio_average = sum(host_ratios.values())/max(1, len(host_ratios))
 
     # large penility for difference of ratios
     for ratio in host_ratios.values():
@@ -215,8 +487,93 @@ def score_host(schedule):
 
     return score
 
+# Calculates score_host for a batch of host schedules at once.
+#
+# Every candidate gets a lane of bits (one per family, see Roster.lane_bit) in a single int, so a
+# night of hosts for the whole batch is one int. Adding the nights into bit sliced counters
+# (counts[b] holds bit b of every lane's host count) counts every family in every candidate with a
+# few int operations per night. The ratio penalty only depends on how many ratio counted hosts in a
+# candidate share each host count and nights_count, and as the families are laid out in 64 bit
+# segments by nights_count those numbers are popcounted out of every segment at once.
+def score_host_batch(roster, candidates):
+    lanes = len(candidates)
+    segments = roster.lane_segments
+    lane_bit = roster.lane_bit.__getitem__
+
+    # pack each night of every candidate into one int
+    nights = [0]*roster.nights
+    scores = [0]*lanes
+    for lane, schedule in enumerate(candidates):
+        shift = 64*segments*lane
+        for night, hosts in enumerate(schedule):
+            nights[night] |= sum(map(lane_bit, hosts)) << shift
+            scores[lane] -= 2*len(hosts)
+
+    host_counts = []
+    repeats = []
+    for night, bits in enumerate(nights):
+        add_bits(host_counts, bits)
+        if 0 < night:
+            add_bits(repeats, bits & nights[night-1])
+
+    for b, plane in enumerate(repeats):
+        counts = segment_counts(plane, segments*lanes)
+        for lane in range(lanes):
+            scores[lane] -= sum(counts[lane*segments:(lane+1)*segments]) << b
+
+    # count the ratio counted hosts in each segment of each lane for every host count
+    exacts = []
+    ratios = []
+    everyone = (1 << 64*segments*lanes) - 1
+    for count in range(1, min(roster.nights, (1 << len(host_counts)) - 1) + 1):
+        exact = everyone
+        for b, plane in enumerate(host_counts):
+            exact &= plane if count >> b & 1 else ~plane
+        if exact:
+            exacts.append(segment_counts(exact, segments*lanes))
+            ratios.extend(count/nights_count for nights_count in roster.lane_groups)
+
+    groups = len(roster.lane_groups)
+    for lane in range(lanes):
+        offset = lane*segments
+        hosts = b''.join(counts[offset:offset+groups] for counts in exacts)
+        ratio_hosts = sum(hosts)
+        if 0 == ratio_hosts:
+            continue
+        average = sum(map(operator.mul, hosts, ratios))/ratio_hosts
+        for ratio, count in zip(itertools.compress(ratios, hosts), itertools.compress(hosts, hosts)):
+            scores[lane] -= count * 2**(52*abs(ratio-average))
+
+    return scores
+
+# adds the bits to a bit sliced counter (a list of bit planes, least significant first)
+def add_bits(counts, bits):
+    for b in range(len(counts)):
+        if not bits:
+            return
+        carry = counts[b] & bits
+        counts[b] ^= bits
+        bits = carry
+    if bits:
+        counts.append(bits)
+
+# the number of bits set in each 64 bit segment of bits, as bytes
+def segment_counts(bits, segments):
+    ones = int.from_bytes(b'\x01'*8*segments, 'little')
+    bits = bits - ((bits >> 1) & 0x55*ones)
+    bits = (bits & 0x33*ones) + ((bits >> 2) & 0x33*ones)
+    bits = (bits + (bits >> 4)) & 0x0f*ones
+    # now each byte holds its own count, so add the 8 bytes of each segment into its first byte
+    bits += bits >> 8
+    bits += bits >> 16
+    bits += bits >> 32
+    return bits.to_bytes(8*segments + 8, 'little')[:8*segments:8]
+
 # Calculates a score for the result
-def score_guest(schedule):
+def score_guest(roster, schedule):
+    space = roster.space
+    strangers = roster.strangers
+
     score = 0
 
     # meets is a dictonary keyed by a family and the values are sets of the families they meet
@@ -230,9 +587,9 @@ def score_guest(schedule):
             attend_count = len(attendees)
 
             meals += attend_count
-            
+
             # medium negitive score for dinners that have lots of free space
-            extra_seats = host.space - attend_count
+            extra_seats = space[host] - attend_count
             if 1 < extra_seats:
                 score -= 2**(extra_seats)
 
@@ -241,7 +598,7 @@ def score_guest(schedule):
                 # create a dictonary for each family
                 if family not in meets:
                     meets[family] = {}
-                
+
                 # keep track of how many other families they meet (and how many times)
                 for match in attendees:
                     meets[family][match] = 1 + meets[family].get(match, 0)
@@ -249,56 +606,137 @@ def score_guest(schedule):
     # large score bonus for feeding everyone
     score += 128 * meals
 
-    # small positive score for more meets
+    # small positive score for more meets, counted by how many times they met (see meet_score)
+    histogram = {}
     for family in meets:
+        row = strangers[family]
         for match, times in meets[family].items():
-            if not set(family.knows).intersection(match.knows):
-                score += 2-(1/times)
+            if row >> match & 1:
+                histogram[times] = histogram.get(times, 0) + 1
 
-    return score
+    return score + meet_score(histogram)
+
+# The same score as score_guest worked out from the schedule as a families by dinners incidence
+# matrix held as bits. Each dinner is a row of bits of its attendees, so a family's row of the meet
+# counts (the incidence matrix times itself) is the sum of the rows of the dinners it is at, which
+# are added masked by its strangers row into a bit sliced counter (see add_bits). Then the number
+# of strangers it met each number of times is one popcount of the counter's planes, without ever
+# going through the pairs one at a time.
+def score_guest_matrix(roster, schedule):
+    space = roster.space
+
+    score = 0
+    meals = 0
+    # the dinners each family is at, as the bits of each dinner's attendees
+    dinners = [[] for _ in range(roster.count)]
+    for hosts in schedule:
+        for host, attendees in hosts.items():
+            meals += len(attendees)
+            score -= seat_penalty(space[host], len(attendees))
+            members = 0
+            for family in attendees:
+                members |= 1 << family
+            for family in attendees:
+                dinners[family].append(members)
+    score += 128 * meals
+
+    return score + meet_score(meet_histogram(roster, dinners))
+
+# the histogram for meet_score of the strangers each family met, from the bits of the families at
+# each dinner each family is at (see score_guest_matrix)
+def meet_histogram(roster, dinners):
+    strangers = roster.strangers
+
+    # most strangers only meet once or twice so stop once every stranger met has been counted
+    histogram = {}
+    for family, rows in enumerate(dinners):
+        row = strangers[family]
+        counts = []
+        met = 0
+        for members in rows:
+            members &= row
+            add_bits(counts, members)
+            met |= members
+        left = met.bit_count()
+        times = 0
+        while 0 < left:
+            times += 1
+            exact = -1
+            for b, plane in enumerate(counts):
+                exact &= plane if times >> b & 1 else ~plane
+            if exact:
+                count = exact.bit_count()
+                histogram[times] = histogram.get(times, 0) + count
+                left -= count
+    return histogram
+
+# the score of the meets in histogram (keyed by how many times two strangers met, holding how many
+# times that happened), added up in order so the scorers agree to the last bit
+def meet_score(histogram):
+    return sum(count*meet_value(times) for times, count in sorted(histogram.items()))
 
 # This can be a scheduler that maybe generates an empy schedule only
 # ? Should it have some kind of margen % or people ?
-def generate_host_schedule(families):
-    # this will be a dictonary keyed by a family and with a value of the number of times they host
-    host_counts = dict.fromkeys(families, 0)
-
-    schedule = [{} for _ in range(len(families[0].attend_nights))]  # Initialize schedule
-    nights = list(range(len(families[0].attend_nights)))
+def generate_host_schedule(roster, sampler=None):
+    size = roster.size
+    space = roster.space
+    host_target = roster.host_target
+    allergies = roster.allergies
+    allergens = roster.allergens
+
+    # this will be a list indexed by a family and with a value of the number of times they host
+    host_counts = [0]*roster.count
+
+    # fixed nights keep their hosts, which count towards the host targets
+    schedule = [{} if None == fixed else {host: [host] for host in fixed} for fixed in roster.fixed]
+    for fixed in roster.fixed:
+        for host in fixed or ():
+            host_counts[host] += 1
+    nights = list(roster.free_nights)
+
+    # when warm starting the nights the input didn't change keep their previous hosts and only the
+    # others are generated again
+    if None != roster.previous:
+        for night in roster.free_nights:
+            if night not in roster.changed_nights:
+                schedule[night] = {host: [host] for host in roster.previous[night]}
+                for host in schedule[night]:
+                    host_counts[host] += 1
+        nights = list(roster.changed_nights)
     random.shuffle(nights)
 
     for night in nights:
-        # loop through allergies and assign hosts that don't have those allergies
-        # get a list of allergies
-        allergies_tonight = {}
-        hosts_tonight = {}
-        priority_hosts_tonight = {}
-        for family in families:
-            if family.attend_nights[night]:
-                allergies_tonight[family.allergies] = allergies_tonight.get(family.allergies, 0) + family.size
-                if family.host_nights[night] and (None == family.host_target or host_counts[family] < family.host_target):
-                    if None != family.host_target:
-                        priority_hosts_tonight[family] = family.space - family.size
-                    else:
-                        hosts_tonight[family] = family.space - family.size
+        # loop through allergies and assign hosts that don't have those allergies, the seats each
+        # allergy needs and the hosts come from the roster so only what changes is worked out here
+        allergies_tonight = dict(roster.demands[night])
+        hosts_tonight = dict(roster.free_seats[night])
+        priority_hosts_tonight = {host: space[host] - size[host] for host in roster.target_hosts[night]
+                                  if host_counts[host] < host_target[host]}
+
+        # can't suffle a dictionay so need a list list for hosts tonight, a sampler draws the order
+        # from what it has learned instead and puts the most restrictive allergies first
+        if None == sampler:
+            host_list_tonight = list(hosts_tonight.keys())
+            random.shuffle(host_list_tonight)
+            allergy_order = roster.demands[night]
+        else:
+            host_list_tonight = sampler.hosts(night, host_counts)
+            allergy_order = sampler.allergies[night]
+
+        # the previous hosts are tried first so as few hosts change as can be
+        if None != roster.previous:
+            host_list_tonight.sort(key=lambda host: host not in roster.previous[night])
 
-        # can't suffle a dictionay so need a list list for hosts tonight
-        # TODO: sort host list by host ratio to generate better schedules automaically
-        host_list_tonight = list(hosts_tonight.keys())
-        random.shuffle(host_list_tonight)
-        
         # find hosts for each allergy
-        # TODO: sort allgesy by most restrictive first (allergies with the fewest hosts that can accomidate them)
-        for allergy in sorted(allergies_tonight.keys(), key=lambda l: (len(l), l), reverse=True):
+        for allergy in allergy_order:
 
             # priority hosts require hosting a certain number of meals
             if priority_hosts_tonight:
-                priority_host_list = list(priority_hosts_tonight.keys())
-                for host in priority_host_list:
-                    if (host in priority_hosts_tonight) and (not allergy.intersection(host.allergens)):
+                for host in roster.priority_hosts[night][allergy]:
+                    if host in priority_hosts_tonight:
                         if host not in schedule[night]:
-                            allergies_tonight[host.allergies] -= host.size # Remove the host size from their allergy
-                            schedule[night][host] = {host} # add the host to the schedule
+                            allergies_tonight[allergies[host]] -= size[host] # Remove the host size from their allergy
+                            schedule[night][host] = [host] # add the host to the schedule
                             host_counts[host] += 1
 
                         # recaculate required space for allergy as well as space requried for allergy set
@@ -311,14 +749,14 @@ def generate_host_schedule(families):
                             del priority_hosts_tonight[host]
                         if 0 >= allergies_tonight[allergy]:
                             break
-            
+
             # If more hosts are needed then look at the main list
             if 0 < allergies_tonight[allergy]:
                 for host in host_list_tonight:
-                    if (host in hosts_tonight) and (not allergy.intersection(host.allergens)):
+                    if (host in hosts_tonight) and (not allergy & allergens[host]):
                         if host not in schedule[night]:
-                            allergies_tonight[host.allergies] -= host.size # Remove the host size from their allergy
-                            schedule[night][host] = {host} # add the host to the schedule
+                            allergies_tonight[allergies[host]] -= size[host] # Remove the host size from their allergy
+                            schedule[night][host] = [host] # add the host to the schedule
                             host_counts[host] += 1
 
                         # recaculate required space for allergy as well as space requried for allergy set
@@ -331,84 +769,1042 @@ def generate_host_schedule(families):
                             del hosts_tonight[host]
                         if 0 >= allergies_tonight[allergy]:
                             break
-            
+
     return schedule
 
 
+# A cross-entropy sampler for generate_host_schedule (--host_search sample). It keeps a chance for
+# each family to host each night and draws the order hosts are tried in from those chances, a host
+# that has already hosted more in the schedule being drawn later, so hosting is spread out. After
+# each batch the chances move towards how often each family hosted each night in the elite of the
+# batch (the --elite share that seat the most and then score best), so later batches are drawn
+# from near the best schedules seen. Chances are kept away from 0 and 1 so every host can still be
+# drawn. Allergies are seated most restrictive first, the ones with the fewest seats at hosts
+# without their allergens.
+class HostSampler:
+    def __init__(self, args, roster):
+        self.roster = roster
+        self.elite = args.elite
+        self.rate = args.learning_rate
+        self.chances = [dict.fromkeys(seats, 0.5) for seats in roster.free_seats]
+        self.allergies = []
+        for night, demands in enumerate(roster.demands):
+            seats = {allergy: sum(free for host, free in roster.free_seats[night].items()
+                                  if not allergy & roster.allergens[host])
+                     for allergy in demands}
+            self.allergies.append(sorted(demands, key=lambda allergy: (seats[allergy], allergy)))
+
+    # the order to try the hosts of night in, given how often each has hosted so far
+    def hosts(self, night, host_counts):
+        keys = {host: random.random()**((1 + host_counts[host])/chance)
+                for host, chance in self.chances[night].items()}
+        return sorted(keys, key=keys.get, reverse=True)
+
+    # learns from a batch of schedules and their scores
+    def update(self, schedules, scores):
+        # only check the shortfall of the best scoring schedules until the elite is full of ones
+        # that seat everyone
+        count = max(1, round(self.elite*len(schedules)))
+        checked = []
+        for i in sorted(range(len(schedules)), key=lambda i: -scores[i]):
+            checked.append((host_shortfall(self.roster, schedules[i]), -scores[i], i))
+            if count <= sum(1 for shortfall, _, _ in checked if 0 == shortfall):
+                break
+        elite = [schedules[i] for _, _, i in sorted(checked)[:count]]
+        share = 1/len(elite)
+        for night in self.roster.free_nights:
+            chances = self.chances[night]
+            hosted = dict.fromkeys(chances, 0)
+            for schedule in elite:
+                for host in schedule[night]:
+                    if host in hosted:
+                        hosted[host] += share
+            for host, chance in chances.items():
+                chance += self.rate*(hosted[host] - chance)
+                chances[host] = min(max(chance, 0.02), 0.98)
+
+# the host schedule a search starts from, which is the best one from the cache (see main) when
+# there is one, otherwise the previous schedule's when warm starting
+def first_host_schedule(args, roster):
+    if None != args.host_start:
+        return [{host: [host] for host in hosts} for hosts in args.host_start]
+    if None == roster.previous:
+        # one generated schedule is seldom a good start, so it is the best scoring of a batch that can
+        # seat the most, of the few best scoring (checking can take a while)
+        candidates = [generate_host_schedule(roster) for _ in range(args.batch)]
+        scores = score_host_batch(roster, candidates)
+        best = sorted(range(len(candidates)), key=lambda c: scores[c], reverse=True)[:8]
+        return candidates[min(best, key=lambda c: (host_shortfall(roster, candidates[c]), -scores[c]))]
+    return [{host: [host] for host in hosts} for hosts in roster.previous]
+
+# An upper bound on host_objective for host schedules that can seat everyone. Every dinner costs 2
+# and each night needs at least as many as it takes its biggest hosts to seat everyone attending.
+# Each host without a target that hosts costs at least 1 for its ratio, and there are at least as
+# many of those as the dinners of the night that needs the most of them once the hosts with a
+# target have hosted all they can. Repeats and churn only take more off. The ratio penalty grows
+# exponentially with how far apart the hosts' ratios are and hosts that attend different numbers
+# of nights can rarely host at the same ratio, so good schedules score well below this and it is
+# too loose for --gap to stop the host searches on (see Stopper).
+def host_bound(roster):
+    dinners = 0
+    ratio_hosts = 0
+    for night in range(roster.nights):
+        if None != roster.fixed[night]:
+            count = len(roster.fixed[night])
+            ratio = sum(1 for host in roster.fixed[night] if None == roster.host_target[host])
+        else:
+            people = sum(roster.size[f] for f in roster.attendees[night])
+            spaces = sorted((roster.space[h] for h in roster.can_host[night]), reverse=True)
+            count = 0
+            seats = 0
+            while seats < people and count < len(spaces):
+                seats += spaces[count]
+                count += 1
+            targets = sum(1 for h in roster.can_host[night] if None != roster.host_target[h])
+            ratio = max(0, count - targets)
+        dinners += count
+        ratio_hosts = max(ratio_hosts, ratio)
+    return -2*dinners - ratio_hosts
+
+# An upper bound on guest_objective: everyone eats every night they attend at a dinner with no
+# empty seats, and at every dinner each family meets as many strangers for the first time as the
+# biggest dinner of the night has room for (meeting a stranger again is worth less than meeting a
+# new one, see meet_value) and itself every time. Churn only takes more off.
+def guest_bound(roster):
+    size = roster.size
+    strangers = roster.strangers
+    bound = 0
+    meals = [0]*roster.count
+    for night in range(roster.nights):
+        attendees = roster.attendees[night]
+        if not attendees:
+            continue
+        for family in attendees:
+            meals[family] += 1
+        hosts = roster.can_host[night] if None == roster.fixed[night] else roster.fixed[night]
+        biggest = max((roster.space[h] for h in hosts), default=0)
+        smallest = min(size[f] for f in attendees)
+        bits = 0
+        for family in attendees:
+            bits |= 1 << family
+        bound += 128*len(attendees)
+        for family in attendees:
+            others = (strangers[family] & bits & ~(1 << family)).bit_count()
+            bound += min(others, max(0, biggest - size[family])//smallest)
+    for family in range(roster.count):
+        if strangers[family] >> family & 1:
+            bound += meet_value(meals[family])
+    return bound
+
+# the number of hosts added or dropped from the previous schedule on the free nights
+def host_churn(roster, schedule):
+    if None == roster.previous:
+        return 0
+    return sum(len(schedule[night].keys() ^ roster.previous[night].keys()) for night in roster.free_nights)
+
+# what the host searches maximize, score_host less the cost of changing the previous schedule
+def host_objective(roster, schedule):
+    return score_host(roster, schedule) - roster.churn*host_churn(roster, schedule)
+
+# The number of people a host schedule can't seat, even ignoring repels and that families can't be
+# split between dinners. Guests with the same compatible hosts are grouped and each night is a max
+# flow from those groups to the hosts' free seats, so a schedule with a shortfall can be thrown out
+# before any time is spent seating it.
+#
+# There are usually only a few groups (one for each set of allergies) so rather than pushing flow
+# the max flow is found as the min cut: for each set of groups left out of the cut, the cut is the
+# demand of the other groups plus the seats of every host that can feed one of them. Hosts that feed
+# the same groups are added together and the seats of the hosts feeding only groups in a set are
+# summed over subsets, which makes every cut a couple of lookups.
+def host_shortfall(roster, schedule):
+    shortfall = 0
+    for night, hosts in enumerate(schedule):
+        hosts_bits = 0
+        for host in hosts:
+            hosts_bits |= 1 << host
+
+        demand = {}
+        for family in roster.attendees[night]:
+            if not hosts_bits >> family & 1:
+                group = roster.compatible[family] & hosts_bits
+                demand[group] = demand.get(group, 0) + roster.size[family]
+        if not demand:
+            continue
+        groups = list(demand)
+        if 10 < len(groups):
+            shortfall += sum(demand.values()) - group_flow(roster, hosts, demand)
+            continue
+
+        # fed[s] is the seats of the hosts that only feed groups in the set s
+        fed = [0]*(1 << len(groups))
+        for host in hosts:
+            feeds = 0
+            for g, group in enumerate(groups):
+                if group >> host & 1:
+                    feeds |= 1 << g
+            fed[feeds] += max(0, roster.space[host] - roster.size[host])
+        for g in range(len(groups)):
+            for s in range(len(fed)):
+                if s >> g & 1:
+                    fed[s] += fed[s ^ 1 << g]
+
+        # cut[s] is the demand of the groups in s, which are the ones cut from the source
+        cut = [0]*len(fed)
+        for s in range(1, len(fed)):
+            low = (s & -s).bit_length() - 1
+            cut[s] = cut[s ^ 1 << low] + demand[groups[low]]
+
+        seats = fed[-1]
+        flow = min(cut[s] + seats - fed[s] for s in range(len(fed)))
+        shortfall += cut[-1] - flow
+    return shortfall
+
+# the max flow from groups of guests (keyed by the bits of the hosts they can go to with the number
+# of people in them as the value) to the free seats of hosts, for when there are too many groups to
+# try every cut
+def group_flow(roster, hosts, demand):
+    capacity = {'source': {}, 'sink': {}}
+    for host in hosts:
+        capacity[host] = {'sink': max(0, roster.space[host] - roster.size[host])}
+    for group, seats in demand.items():
+        capacity['source'][('group', group)] = seats
+        capacity[('group', group)] = {host: seats for host in hosts if group >> host & 1}
+    return max_flow(capacity, 'source', 'sink')
+
+# the max flow through capacity (a dictonary of dictonaries of edge capacities) by edmonds-karp
+def max_flow(capacity, source, sink):
+    residual = {node: dict(edges) for node, edges in capacity.items()}
+    for node, edges in capacity.items():
+        for other in edges:
+            residual.setdefault(other, {}).setdefault(node, 0)
+
+    flow = 0
+    while True:
+        # breadth first search for the shortest path with room left
+        parents = {source: None}
+        queue = [source]
+        for node in queue:
+            for other, room in residual[node].items():
+                if 0 < room and other not in parents:
+                    parents[other] = node
+                    queue.append(other)
+            if sink in parents:
+                break
+        if sink not in parents:
+            return flow
+
+        path = []
+        node = sink
+        while source != node:
+            path.append((parents[node], node))
+            node = parents[node]
+        room = min(residual[a][b] for a, b in path)
+        for a, b in path:
+            residual[a][b] -= room
+            residual[b][a] += room
+        flow += room
+
+# Decides when a search phase is done.
+#
+# A phase runs until args.deadline (main splits --time between the phases) but stops early once its
+# best score reaches its target or the bound on it, once it has gone --stall_runs runs without
+# improving (stall_runs of the roster by default), or once it has gone --stall_time seconds plus as
+# long as it took to reach its last improvement without improving again. That last rule gives a
+# search that is still finding improvements now and then as long again to find the next one, while
+# small inputs that settle quickly finish quickly.
+class Stopper:
+    def __init__(self, args, roster, target, bound=None, loose=False):
+        self.start = time.time()
+        self.deadline = args.deadline
+        self.target = target
+        # with --gap the search is good enough once it is that close to the bound on its score, unless
+        # the bound is too loose for that to be likely (see host_bound) when it is only reported
+        self.bound = bound
+        if None != bound and None != args.gap and not loose:
+            gap_target = bound - args.gap*max(1, abs(bound))
+            self.target = gap_target if None == target else min(target, gap_target)
+        self.stall_runs = stall_runs(roster) if None == args.stall_runs else args.stall_runs
+        self.stall_time = args.stall_time
+        self.score = -math.inf
+        self.improved_time = self.start
+        self.improved_runs = 0
+        self.trajectory = []
+        self.notify = args.notify
+
+    # records the score after the given number of runs, telling args.notify (see run_phases) about it
+    def update(self, score, runs):
+        if self.score < score:
+            self.score = score
+            self.improved(runs)
+            if math.isfinite(score):
+                self.trajectory.append((round(self.improved_time - self.start, 6), runs, score))
+                if None != self.notify:
+                    self.notify(score)
+                if None != self.bound:
+                    multiprocessing.get_logger().info("gap: %.6f" % self.gap())
+
+    # records an improvement the score doesn't show, like seating more guests
+    def improved(self, runs):
+        self.improved_time = time.time()
+        self.improved_runs = runs
+
+    # checks if the phase should stop after the given number of runs
+    def done(self, runs):
+        now = time.time()
+        if self.deadline < now:
+            return True
+        if None != self.target and self.target <= self.score:
+            return True
+        if None != self.bound and self.bound <= self.score:
+            return True
+        if 0 < self.stall_runs and self.stall_runs < runs - self.improved_runs:
+            return True
+        if 0 < self.stall_time and \
+                self.stall_time + (self.improved_time - self.start) < now - self.improved_time:
+            return True
+        return False
+
+    # how far the score is from the bound, as a fraction of the bound (see --gap)
+    def gap(self):
+        if None == self.bound or not math.isfinite(self.score):
+            return None
+        return (self.bound - self.score)/max(1, abs(self.bound))
+
+    # the fraction of the phase's time that has passed
+    def progress(self):
+        return min(1, (time.time() - self.start)/max(self.deadline - self.start, 1e-9))
+
+# The runs a phase goes without improving before it stops when --stall_runs isn't given. The host
+# schedules and seatings there are to search grow exponentially with the families and so do the runs
+# between improvements, from a few hundred for a score of families to more than a phase gets through
+# in a minute for twice that, so this only stops the searches of small inputs early.
+def stall_runs(roster):
+    return int(2**(roster.count/2))
+
+# What a search worker did, for --metrics.
+#
+# Each search splits its time into laps named for the part of the search they were spent in (like
+# generate, score or step) by calling lap with the perf_counter the lap started at, which returns the
+# perf_counter the next lap starts at. The runs, score trajectory and time to improve come from the
+# phase's Stopper when the report is made.
+class Metrics:
+    def __init__(self, phase):
+        self.phase = phase
+        self.timings = {}
+
+    # adds the time since since to the lap called name, returning the time now
+    def lap(self, name, since):
+        now = time.perf_counter()
+        self.timings[name] = self.timings.get(name, 0) + now - since
+        return now
+
+    # a dictonary of what the worker did, which can be written out as JSON
+    def report(self, stopper, runs):
+        seconds = time.time() - stopper.start
+        return {
+            'phase': self.phase,
+            'worker': multiprocessing.current_process().name,
+            'runs': runs,
+            'seconds': round(seconds, 6),
+            'runs_per_second': round(runs/max(seconds, 1e-9), 3),
+            'score': stopper.score if math.isfinite(stopper.score) else None,
+            'bound': stopper.bound,
+            'gap': stopper.gap(),
+            'improvements': len(stopper.trajectory),
+            'last_improvement': round(stopper.improved_time - stopper.start, 6),
+            'timings': {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            'trajectory': stopper.trajectory,
+            }
+
+# The best schedule and score any worker has found, shared between the worker processes.
+#
+# Every --migration seconds each worker calls migrate, publishing its best schedule when it beats
+# the shared one or getting the shared one back when it is better, so workers stop spending their
+# time in parts of the search another worker has already beaten. The schedule is packed (see
+# pack_schedule) into a block of shared memory sized for the roster.
+class SharedBest:
+    def __init__(self, roster):
+        self.lock = multiprocessing.Lock()
+        self.score = multiprocessing.RawValue('d', -math.inf)
+        self.starved = multiprocessing.RawValue('d', math.inf)
+        self.length = multiprocessing.RawValue('L', 0)
+        self.data = multiprocessing.RawArray('l', packed_size(roster))
+
+    # publishes the schedule if it is better, otherwise returns the shared (score, schedule) if that
+    # is better, a schedule that starves fewer families (or with find_schedule can't seat fewer
+    # people, see host_shortfall) is better whatever its score
+    def migrate(self, score, schedule, starved=0):
+        if (-self.starved.value, self.score.value) < (-starved, score):
+            packed = pack_schedule(schedule)
+            with self.lock:
+                if (-self.starved.value, self.score.value) < (-starved, score):
+                    self.data[:len(packed)] = packed
+                    self.length.value = len(packed)
+                    self.score.value = score
+                    self.starved.value = starved
+            return None
+
+        if (-starved, score) < (-self.starved.value, self.score.value):
+            with self.lock:
+                shared = (self.score.value, self.data[:self.length.value])
+            return shared[0], unpack_schedule(shared[1])
+
+        return None
+
+# Saves a worker's best score and schedule into the --cache directory every --checkpoint seconds, so
+# a run that is cut short can be picked back up with --resume. The files are named for the cache key
+# (see cache_key), the phase and the worker.
+class Checkpoint:
+    def __init__(self, args, phase):
+        self.filename = None
+        if None != args.cache and 0 < args.checkpoint:
+            self.filename = os.path.join(args.cache, '%s-%s-%s.pickle' % (
+                    args.cache_key, phase, multiprocessing.current_process().name))
+        self.every = args.checkpoint
+        self.last = time.time()
+
+    # saves the score and schedule if it has been long enough since the last save
+    def save(self, score, schedule):
+        if None == self.filename or time.time() - self.last < self.every:
+            return
+        self.last = time.time()
+        save_pickle(self.filename, (score, schedule))
+
+# the name results for this input are cached under: a hash of the parsed families, the settings
+# that change what can be seated and how schedules score, and the previous schedule when warm starting
+def cache_key(roster):
+    data = pickle.dumps(([f.email for f in roster.families], roster.size, roster.space, roster.host_target,
+                         roster.allergies, roster.allergens, roster.knows, roster.repel, roster.attend,
+                         roster.host, roster.fixed, roster.previous, roster.churn), pickle.HIGHEST_PROTOCOL)
+    return hashlib.sha256(data).hexdigest()
+
+# writes value to filename by way of a temporary file, so an interrupted write never leaves half a file
+def save_pickle(filename, value):
+    with open(filename + '.tmp', 'wb') as file:
+        pickle.dump(value, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp', filename)
+
+# reads a value written by save_pickle, None if there isn't one
+def load_pickle(filename):
+    try:
+        with open(filename, 'rb') as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+
 # Orignally I was planning on useing simulating annealing it the generate_schedule function however
 # does not support any way to choose where you are jumping so we are using the much simplier run
-# for a while and keep the best match option.
-def find_schedule(args, families):
+# for a while and keep the best match option. HostSearch below is the annealing version, which
+# makes its own moves instead of using generate_host_schedule.
+def find_schedule(args, roster, shared=None, publish=None):
 
     log = multiprocessing.get_logger()
 
-    start_time = time.time()
+    stopper = Stopper(args, roster, args.target_host, host_bound(roster), loose=True)
+    metrics = Metrics('host')
+    checkpoint = Checkpoint(args, 'host')
+    last_migration = stopper.start
+
+    since = time.perf_counter()
+    current_schedule = first_host_schedule(args, roster)
+    current_score = host_objective(roster, current_schedule)
+    current_shortfall = host_shortfall(roster, current_schedule)
+    if 0 == current_shortfall:
+        stopper.update(current_score, 0)
+    published = -math.inf
+    sampler = HostSampler(args, roster) if 'sample' == args.host_search else None
+    since = metrics.lap('generate', since)
+
+    # loop till the stopper says we are done
+    k = 0
+    while True:
+        k += args.batch
+
+        # generate a block of schedules and score them together
+        new_schedules = [generate_host_schedule(roster, sampler) for _ in range(args.batch)]
+        since = metrics.lap('generate', since)
+        new_scores = score_host_batch(roster, new_schedules)
+        if 0 != roster.churn:
+            new_scores = [score - roster.churn*host_churn(roster, new_schedule)
+                          for new_schedule, score in zip(new_schedules, new_scores)]
+        since = metrics.lap('score', since)
+        if None != sampler:
+            sampler.update(new_schedules, new_scores)
+            since = metrics.lap('sample', since)
+        for new_schedule, new_score in zip(new_schedules, new_scores):
+            # only check if the schedule can seat everyone when it would be kept
+            if current_score < new_score or 0 < current_shortfall:
+                new_shortfall = host_shortfall(roster, new_schedule)
+                if current_shortfall < new_shortfall or \
+                        (current_shortfall == new_shortfall and new_score <= current_score):
+                    continue
+                current_schedule = new_schedule
+                current_score = new_score
+                current_shortfall = new_shortfall
+
+                # the score of a schedule that can't seat everyone isn't held to the target or bound
+                # (see host_bound), it only counts as progress
+                if 0 == current_shortfall:
+                    stopper.update(current_score, k)
+                else:
+                    stopper.improved(k)
+
+                # print out progress
+                if log.isEnabledFor(logging.INFO):
+                    host_summery(roster, current_schedule)
+                    log.info("runs: " + str(k))
+                    log.info("score: " + str(current_score))
+        since = metrics.lap('check', since)
+
+        # check after every batch, a batch of schedules that can't seat everyone takes a while
+        if stopper.done(k):
+            break
+        checkpoint.save(current_score, current_schedule)
+
+        # hand new bests that seat everyone on to the guest search when pipelining
+        if None != publish and 0 == current_shortfall and published < current_score:
+            published = current_score
+            publish(current_score, current_schedule)
+
+        # swap with the other workers, mixing in the shared best when it is better
+        if None != shared and args.migration < time.time() - last_migration:
+            last_migration = time.time()
+            adopted = shared.migrate(current_score, current_schedule, current_shortfall)
+            if None != adopted:
+                children = [adopted[1]]
+                for _ in range(args.batch):
+                    child = crossover_hosts(roster, current_schedule, adopted[1])
+                    if None != child:
+                        children.append(child)
+                for child, score in zip(children, score_host_batch(roster, children)):
+                    score -= roster.churn*host_churn(roster, child)
+                    if (0 < current_shortfall or current_score < score) and 0 == host_shortfall(roster, child):
+                        current_schedule = child
+                        current_score = score
+                        current_shortfall = 0
+                if 0 == current_shortfall:
+                    stopper.update(current_score, k)
+                log.info("migrated score: " + str(current_score))
+        since = metrics.lap('migrate', since)
+
+    log.warning("runs: %d in %.3f seconds" % (k, time.time() - stopper.start))
+
+    return current_schedule, metrics.report(stopper, k)
+
+# mixes two host schedules night by night, which keeps every night's seats as they were in one of
+# the parents, returns None if the mix has a host going over their host_target
+def crossover_hosts(roster, a, b):
+    child = [dict(random.choice((a[night], b[night]))) for night in range(roster.nights)]
+    host_counts = {}
+    for hosts in child:
+        for host in hosts:
+            host_counts[host] = host_counts.get(host, 0) + 1
+            if None != roster.host_target[host] and roster.host_target[host] < host_counts[host]:
+                return None
+    return child
+
+# Simulated annealing over host schedules.
+#
+# Starting from a generated schedule this makes small moves: swapping a host for another family on
+# the same night, shifting a host's dinner to another night, and dropping or adding a host. The
+# parts of score_host are kept up to date as moves are made. Moves that leave a night without
+# enough compatible seats for its guests are allowed but penalized by the seats missing so the
+# search can pass through them, however only schedules that seat everyone are kept as the best.
+class HostSearch:
+    def __init__(self, roster, schedule, slack=0):
+        self.roster = roster
+        self.slack = slack
+        self.schedule = schedule
+        self.nights = range(len(schedule))
+
+        # the parts of score_host
+        self.host_counts = [0]*roster.count
+        self.dinners = 0
+        self.repeats = 0
+        # ratios is keyed by host ratio and holds how many (ratio counted) hosts have it
+        self.ratios = {}
+        self.ratio_sum = 0
+        # the hosts changed from the previous schedule when warm starting, see host_churn
+        self.changes = host_churn(roster, schedule)
+
+        # the seats each night's guests need for each set of allergies (see Roster.demands), the free
+        # seats of the hosts that can feed each of them and the free seats of all the hosts, kept up
+        # to date by seat so the deficit of a night doesn't have to go through its families
+        self.needs = [dict(demands) for demands in roster.demands]
+        self.rooms = [dict.fromkeys(demands, 0) for demands in roster.demands]
+        self.room_totals = [0]*len(schedule)
+
+        for night in self.nights:
+            for host in schedule[night]:
+                self.count(host, 1)
+                self.seat(host, night, 1)
+                self.dinners += 1
+                if 0 < night and host in schedule[night-1]:
+                    self.repeats += 1
+
+        self.deficits = [self.deficit(night) for night in self.nights]
+        self.deficit_total = sum(self.deficits)
+
+    # changes how many times a host hosts, keeping the ratio tallies up to date
+    def count(self, host, change):
+        count = self.host_counts[host]
+        self.host_counts[host] = count + change
+        if None != self.roster.host_target[host]:
+            return
+        for count, sign in ((count, -1), (count + change, 1)):
+            if 0 < count:
+                ratio = count/self.roster.nights_count[host]
+                self.ratios[ratio] = self.ratios.get(ratio, 0) + sign
+                self.ratio_sum += sign*ratio
+
+    # changes the seats of a night for a host being added (change 1) or removed (change -1)
+    def seat(self, host, night, change):
+        roster = self.roster
+        free = change*(roster.space[host] - roster.size[host])
+        needs = self.needs[night]
+        if roster.allergies[host] in needs:
+            needs[roster.allergies[host]] -= change*roster.size[host]
+        self.room_totals[night] += free
+        rooms = self.rooms[night]
+        for allergy in rooms:
+            if not allergy & roster.allergens[host]:
+                rooms[allergy] += free
+
+    # The number of seats a night is short, both overall and for each allergy. Overall a night is
+    # also short if it has less than slack free seats for each dinner (see --slack), as seats can
+    # only be filled by whole families that don't repel each other. Nights that can't change are
+    # never short.
+    def deficit(self, night):
+        if None != self.roster.fixed[night]:
+            return 0
+        needs = self.needs[night]
+        rooms = self.rooms[night]
+        slack = math.ceil(self.slack*len(self.schedule[night]))
+        deficit = max(0, sum(needs.values()) + slack - self.room_totals[night])
+        for allergy, seats in needs.items():
+            deficit += max(0, seats - rooms[allergy])
+        return deficit
+
+    # the current host_objective of the schedule
+    def score(self):
+        score = -2*self.dinners - self.repeats - self.roster.churn*self.changes
+        ratio_hosts = sum(self.ratios.values())
+        if 0 < ratio_hosts:
+            average = self.ratio_sum/ratio_hosts
+            for ratio, hosts in self.ratios.items():
+                if 0 < hosts:
+                    score -= hosts * 2**(52*abs(ratio-average))
+        return score
+
+    # the score the annealing uses, which includes the penalty for missing seats
+    def energy(self):
+        return self.score() - 64*self.deficit_total
+
+    # adds (change 1) or removes (change -1) a host from a night
+    def toggle(self, host, night, change):
+        if 0 < change:
+            self.schedule[night][host] = [host]
+        else:
+            del self.schedule[night][host]
+        self.count(host, change)
+        self.seat(host, night, change)
+        self.dinners += change
+        if None != self.roster.previous:
+            self.changes += -change if host in self.roster.previous[night] else change
+        for other in (night - 1, night + 1):
+            if 0 <= other < len(self.schedule) and host in self.schedule[other]:
+                self.repeats += change
+        deficit = self.deficit(night)
+        self.deficit_total += deficit - self.deficits[night]
+        self.deficits[night] = deficit
+
+    # checks if a family may host another dinner
+    def may_host(self, family, night):
+        host_target = self.roster.host_target[family]
+        return self.roster.host[family] >> night & 1 and family not in self.schedule[night] and \
+                (None == host_target or self.host_counts[family] < host_target)
+
+    # picks a random move and returns the list of toggles it makes, or None if it can't be done.
+    # When warm starting only the nights the input changed are moved, the others keep their hosts.
+    def propose(self):
+        nights = self.roster.changed_nights
+        if not nights:
+            return None
+        night = random.choice(nights)
+        hosts = self.schedule[night]
+        can_host = self.roster.can_host[night]
+        move = random.randrange(4)
+
+        # swap a host for another family tonight
+        if 0 == move:
+            if not hosts or not can_host:
+                return None
+            host = random.choice(list(hosts))
+            family = random.choice(can_host)
+            if family == host or not self.may_host(family, night):
+                return None
+            return [(host, night, -1), (family, night, 1)]
+
+        # shift a host's dinner to another night
+        if 1 == move:
+            if not hosts:
+                return None
+            host = random.choice(list(hosts))
+            other = random.choice(nights)
+            if self.roster.host[host] >> other & 1 and host not in self.schedule[other]:
+                return [(host, night, -1), (host, other, 1)]
+            return None
+
+        # drop a host
+        if 2 == move:
+            if not hosts:
+                return None
+            return [(random.choice(list(hosts)), night, -1)]
+
+        # add a host
+        if not can_host:
+            return None
+        family = random.choice(can_host)
+        if not self.may_host(family, night):
+            return None
+        return [(family, night, 1)]
+
+    # tries a random move, keeping it by the metropolis rule at the given temperature
+    def step(self, temperature):
+        toggles = self.propose()
+        if None == toggles:
+            return False
+
+        energy = self.energy()
+        for host, night, change in toggles:
+            self.toggle(host, night, change)
+        delta = self.energy() - energy
+
+        if 0 <= delta or random.random() < math.exp(delta/temperature):
+            return True
+        for host, night, change in reversed(toggles):
+            self.toggle(host, night, -change)
+        return False
+
+# anneals a generated host schedule for the specified time
+def search_hosts(args, roster, shared=None, publish=None):
+    log = multiprocessing.get_logger()
 
-    current_schedule = generate_host_schedule(families)
-    current_score = score_host(current_schedule)
+    stopper = Stopper(args, roster, args.target_host, host_bound(roster), loose=True)
+    metrics = Metrics('host')
+    checkpoint = Checkpoint(args, 'host')
+    last_migration = stopper.start
+
+    since = time.perf_counter()
+    search = HostSearch(roster, first_host_schedule(args, roster), args.slack)
+    current_schedule = [{host: [host] for host in hosts} for hosts in search.schedule]
+    current_score = host_objective(roster, current_schedule)
+    if 0 < host_shortfall(roster, current_schedule):
+        current_score = -math.inf # anything that seats everyone is better
+    stopper.update(current_score, 0)
+    published = -math.inf
+    # the best schedule with no deficit since the last check, which is only kept if it can seat
+    # everyone (host_shortfall takes a while so it is checked once every 1000 steps)
+    candidate = None
+    candidate_score = -math.inf
+    since = metrics.lap('generate', since)
+
+    # cool geometrically from the starting temperature to a thousandth of it over the time given
+    temperature = args.temperature
 
-    # loop whatever number of times you would like
-    # TODO: make this a bit more intellegent, maybe loop till you haven't found a better solution
-    #           in 10k runs or something
     j = 0
     k = 0
     while True:
         j += 1
         k += 1
 
-        new_schedule = generate_host_schedule(families)
-        new_score = score_host(new_schedule)
-        if current_score < new_score:
-            current_schedule = new_schedule
-            current_score = new_score
+        search.step(temperature)
 
-            # print out progress
-            host_summery(current_schedule)
-            log.info("runs: " + str(k))
-            log.info("score: " + str(current_score))
+        if 0 == search.deficit_total and max(current_score, candidate_score) < search.score():
+            candidate = [{host: [host] for host in hosts} for hosts in search.schedule]
+            candidate_score = search.score()
 
-        # keep reseting j till we have ran for the specified time
+        # keep the best schedule that seats everyone and keep reseting j till we are done
         if 1000 < j:
-            if args.time < time.time() - start_time:
+            if None != candidate and 0 == host_shortfall(roster, candidate):
+                current_schedule = candidate
+                current_score = host_objective(roster, current_schedule)
+                stopper.update(current_score, k)
+
+                # print out progress
+                if log.isEnabledFor(logging.INFO):
+                    host_summery(roster, current_schedule)
+                    log.info("runs: " + str(k))
+                    log.info("score: " + str(current_score))
+            candidate = None
+            candidate_score = -math.inf
+
+            since = metrics.lap('step', since)
+            if stopper.done(k):
                 break
             else:
+                temperature = args.temperature * 0.001**stopper.progress()
                 j = 0
+            checkpoint.save(current_score, current_schedule)
+
+            # hand new bests on to the guest search when pipelining
+            if None != publish and published < current_score:
+                published = current_score
+                publish(current_score, current_schedule)
+
+            # swap with the other workers, carrying on from the shared best when it is better
+            if None != shared and args.migration < time.time() - last_migration:
+                last_migration = time.time()
+                adopted = shared.migrate(current_score, current_schedule)
+                if None != adopted:
+                    current_score, current_schedule = adopted
+                    search = HostSearch(roster, [{host: [host] for host in hosts}
+                                                 for hosts in current_schedule], args.slack)
+                    stopper.update(current_score, k)
+                    log.info("migrated score: " + str(current_score))
+            since = metrics.lap('migrate', since)
+
+    log.warning("runs: %d in %.3f seconds" % (k, time.time() - stopper.start))
+
+    return current_schedule, metrics.report(stopper, k)
+
+# Searches hosts and guests together (--joint), so what guests make of a dinner can decide who hosts.
+# Most steps are GuestSearch moves, the rest (--joint_moves of them) are HostSearch's moves with the
+# guests of a dinner that ends and its host seated again (by GuestSearch.augment) and new dinners
+# filled with the starved guests and then guests that are as happy there. A host move that leaves
+# fewer families unseated than before is kept and one that leaves more is undone, as the host score
+# can change by far more than the meals are worth, otherwise a step is kept by the metropolis rule on
+# the --host_weight times host_objective plus guest_objective, both kept up to date as the search
+# goes, with every change journaled so a step can be undone.
+class JointSearch:
+    def __init__(self, roster, schedule, host_weight):
+        self.roster = roster
+        self.host_weight = host_weight
+        self.host_search = HostSearch(roster, [{host: [host] for host in hosts} for hosts in schedule])
+        self.guest_search = GuestSearch(roster, schedule)
+        self.schedule = self.guest_search.schedule
+
+    # the combined objective
+    def score(self):
+        return self.host_weight*self.host_search.score() + self.guest_search.score
+
+    # the number of families not seated on the nights
+    def starved(self, nights):
+        search = self.guest_search
+        return sum(1 for night in nights for guest in search.guests[night] if None == search.seated[night][guest])
+
+    # adds (change 1) or removes (change -1) a host from a night, leaving the families that were at
+    # the dinner (or the new host) not seated
+    def toggle(self, host, night, change, journal):
+        search = self.guest_search
+        if 0 < change:
+            if None != search.seated[night][host]:
+                search.move(host, night, search.seated[night][host], None)
+            search.open(host, night)
+        else:
+            for guest in list(self.schedule[night][host]):
+                if guest != host:
+                    search.move(guest, night, host, None)
+            search.close(host, night)
+        self.host_search.toggle(host, night, change)
+        journal.append((self.host_search.toggle, (host, night, -change)))
+
+    # seats the starved guests of a night at a new dinner and then any other guest who doesn't mind
+    def fill(self, host, night):
+        search = self.guest_search
+        starved = [g for g in search.guests[night] if None == search.seated[night][g]]
+        others = [g for g in search.guests[night] if None != search.seated[night][g]]
+        random.shuffle(others)
+        for guest in starved + others:
+            if 0 < search.seats[night][host] and search.fits(guest, night, host):
+                src = search.seated[night][guest]
+                if 0 > search.move(guest, night, src, host):
+                    search.move(guest, night, host, src)
+
+    # tries a random host move, keeping it by the metropolis rule at the given temperature
+    def step(self, temperature):
+        toggles = self.host_search.propose()
+        if None == toggles:
+            return False
 
+        nights = {night for _, night, _ in toggles}
+        score = self.score()
+        search = self.guest_search
+        unseated = {(night, guest) for night in nights for guest in search.guests[night]
+                    if None == search.seated[night][guest]}
+        journal = []
+        self.guest_search.journal = journal
+        for host, night, change in toggles:
+            self.toggle(host, night, change, journal)
+        for host, night, change in toggles:
+            if 0 < change and host in self.schedule[night]:
+                self.fill(host, night)
+        # the guests that were already starved couldn't be seated by augment before so only the ones
+        # the move left without a seat are tried
+        for night in nights:
+            for guest in list(search.guests[night]):
+                if None == search.seated[night][guest] and (night, guest) not in unseated:
+                    search.augment(guest, night)
+        search.journal = None
+        delta = self.score() - score
+
+        starved = len(unseated)
+        after = self.starved(nights)
+        if after < starved or (after == starved and (0 <= delta or random.random() < math.exp(delta/temperature))):
+            return True
+        for function, arguments in reversed(journal):
+            function(*arguments)
+        return False
+
+# Searches hosts and guests together with JointSearch for the whole --time, keeping the best schedule,
+# which is the one that leaves the fewest families unseated and then scores best. Like find_schedule
+# only the scores of schedules that seat everyone count towards the target and bound. Host moves only
+# go a little way in the time there is on big inputs, so where the search starts decides most of its
+# host score and it starts from the best of a batch of host schedules (see first_host_schedule).
+def search_joint(args, roster, shared=None):
+    log = multiprocessing.get_logger()
 
-    log.warning("runs: " + str(k))
+    stopper = Stopper(args, roster, None, args.host_weight*host_bound(roster) + guest_bound(roster))
+    metrics = Metrics('joint')
+    checkpoint = Checkpoint(args, 'guest')
+    last_migration = stopper.start
 
-    return current_schedule
+    since = time.perf_counter()
+    if None != args.guest_start:
+        start = [{host: list(attendees) for host, attendees in hosts.items()} for hosts in args.guest_start]
+    else:
+        start = fill_schedule(roster, first_host_schedule(args, roster))
+    search = JointSearch(roster, start, args.host_weight)
+    search.guest_search.repair()
+    best_score = search.score()
+    best_starved = search.starved(roster.free_nights)
+    best_schedule = [{host: list(attendees) for host, attendees in hosts.items()} for hosts in search.schedule]
+    if 0 == best_starved:
+        stopper.update(best_score, 0)
+    since = metrics.lap('fill', since)
+
+    # cool geometrically from the starting temperature to a thousandth of it over the time given
+    temperature = args.temperature
 
-# uses find_schedule in a thread
-def find_schedule_process(args, families, schedules):
-    schedule = find_schedule(args, families)
-    schedules.put(schedule)
+    j = 0
+    k = 0
+    while True:
+        j += 1
+        k += 1
+
+        if random.random() < args.joint_moves:
+            search.step(temperature)
+        else:
+            search.guest_search.step()
+
+        # keep the best schedule and keep reseting j till we are done, a step can take a while on
+        # big inputs so the deadline is checked after each one
+        if 1000 < j or stopper.deadline < time.time():
+            since = metrics.lap('step', since)
+            score = search.score()
+            starved = search.starved(roster.free_nights)
+            if starved < best_starved or (starved == best_starved and best_score < score):
+                best_score = score
+                best_starved = starved
+                best_schedule = [{host: list(attendees) for host, attendees in hosts.items()}
+                                 for hosts in search.schedule]
+                if 0 == best_starved:
+                    stopper.update(best_score, k)
+                else:
+                    stopper.improved(k)
+                if log.isEnabledFor(logging.INFO):
+                    summery(roster, best_schedule)
+                    log.info("Joint runs: " + str(k))
+                    log.info("Joint score: " + str(best_score))
+            if stopper.done(k):
+                break
+            else:
+                temperature = args.temperature * 0.001**stopper.progress()
+                j = 0
+            checkpoint.save(best_score, best_schedule)
+
+            # swap with the other workers, carrying on from the shared best when it is better
+            if None != shared and args.migration < time.time() - last_migration:
+                last_migration = time.time()
+                adopted = shared.migrate(best_score, best_schedule, best_starved)
+                if None != adopted:
+                    best_score, best_schedule = adopted
+                    search = JointSearch(roster, [{host: list(attendees) for host, attendees in hosts.items()}
+                                                  for hosts in best_schedule], args.host_weight)
+                    best_starved = search.starved(roster.free_nights)
+                    if 0 == best_starved:
+                        stopper.update(best_score, k)
+                    else:
+                        stopper.improved(k)
+                    log.info("Joint migrated score: " + str(best_score))
+            since = metrics.lap('migrate', since)
+
+    log.warning("Joint runs: %d in %.3f seconds" % (k, time.time() - stopper.start))
+
+    return best_schedule, metrics.report(stopper, k)
+
+# uses search_joint in a process, sending back the packed schedule with what main picks the best by
+# (the fewest starved meals and then the combined score)
+def joint_process(args, roster, schedules, shared=None):
+    schedule, record = profiled(args, 'joint', search_joint, args, roster, shared)
+    schedules.put(((-starved_meals(roster, schedule), combined_score(roster, schedule, args.host_weight)),
+                   pack_schedule(schedule), record))
+
+# uses find_schedule (or search_hosts) in a process, sending back the packed schedule with what main
+# picks the best by (preferring schedules that seat everyone) so main doesn't have to score them
+def find_schedule_process(args, roster, schedules, shared=None):
+    if 'anneal' == args.host_search:
+        schedule, record = profiled(args, 'host', search_hosts, args, roster, shared)
+    else:
+        schedule, record = profiled(args, 'host', find_schedule, args, roster, shared)
+    schedules.put(((-host_shortfall(roster, schedule), host_objective(roster, schedule)),
+                   pack_schedule(schedule), record))
+
+# runs function with the arguments, under cProfile when --profile is given with the stats saved in
+# that directory as <phase>-<process name>.prof
+def profiled(args, phase, function, *arguments):
+    if None == args.profile:
+        return function(*arguments)
+    profile = cProfile.Profile()
+    result = profile.runcall(function, *arguments)
+    profile.dump_stats(os.path.join(args.profile,
+                                    '%s-%s.prof' % (phase, multiprocessing.current_process().name)))
+    return result
 
 # fills an exisitng schedule with new guests
-def fill_schedule(families, host_schedule):
-    schedule = [{} for _ in range(len(families[0].attend_nights))]  # Initialize schedule
-    nights = list(range(len(families[0].attend_nights)))
+def fill_schedule(roster, host_schedule):
+    size = roster.size
+    compatible = roster.compatible
+    conflicts = roster.conflicts
+
+    schedule = [{} for _ in range(roster.nights)]  # Initialize schedule
+    nights = list(range(roster.nights))
 
     for night in nights:
+        # fixed nights are copied as they are
+        if None != roster.fixed[night]:
+            schedule[night] = {host: list(attendees) for host, attendees in roster.fixed[night].items()}
+            continue
+
         # copy the host night schedule over
         #schedule[night] = host_schedule[night].copy()
         for host in host_schedule[night]:
-            schedule[night][host] = {host}
+            schedule[night][host] = [host]
 
 
         # Find all the families that need a dinner this night and count how many seats are needed
         families_tonight = []
         hosts_tonight = {}
-        assigned = set()  # Keep track of families that have been assigned to a dinner
-        for family in families:
-            if family.attend_nights[night]:
-                if family in schedule[night]:
-                    hosts_tonight[family] = family.space-family.size # track host remaining seats
-                else:
-                    families_tonight.append(family)
+        members = {} # the bits of the families at each dinner, for checking repels
+        for family in roster.attendees[night]:
+            if family in schedule[night]:
+                hosts_tonight[family] = roster.space[family]-size[family] # track host remaining seats
+                members[family] = 1 << family
+            else:
+                families_tonight.append(family)
 
         random.shuffle(families_tonight)  # Shuffle the list of families
-        
+
         for guest in families_tonight:
             # generate a host_list that we can shuffle
             host_list = list(hosts_tonight.keys())
@@ -416,21 +1812,17 @@ def fill_schedule(families, host_schedule):
             for host in host_list:
 
                 # check if the guest is avaiable and not allergic to the host
-                if      guest.allergies.intersection(host.allergens) or \
-                        hosts_tonight[host] < guest.size:
+                if      not compatible[guest] >> host & 1 or \
+                        hosts_tonight[host] < size[guest]:
                     continue
 
                 # check for repels
-                repel = False
-                for other in schedule[night][host]:
-                    if guest.repel.intersection(other.repel):
-                        repel = True
-                        break
-                if repel:
+                if conflicts[guest] & members[host]:
                     continue
 
-                schedule[night][host].add(guest)
-                hosts_tonight[host] -= guest.size
+                schedule[night][host].append(guest)
+                members[host] |= 1 << guest
+                hosts_tonight[host] -= size[guest]
                 if(0 >= hosts_tonight[host]):
                     del hosts_tonight[host]
 
@@ -438,50 +1830,958 @@ def fill_schedule(families, host_schedule):
 
     return schedule
 
+# A guest schedule for one host schedule that optimize_schedule fills again and again in place,
+# instead of fill_schedule building a new schedule every time. Each night's hosts have a slot in
+# arrays of the seats left at their dinners, the bits of the families at them and how many there
+# are, and each family has the slot it is seated at (-1 for none), which filling resets from the
+# arrays the dinners start with. A fill is scored straight from those arrays (see meet_histogram)
+# and the best one kept as a copy of the seated slots, a schedule is only built from it when one
+# is needed. Fixed nights keep their dinners as the start of their slots and are never filled.
+class Seating:
+    def __init__(self, roster, host_schedule):
+        self.roster = roster
+        self.hosts = []
+        self.start_seats = []
+        self.start_members = []
+        self.start_counts = []
+        self.guests = []
+        self.host_bits = []
+        for night, hosts in enumerate(host_schedule):
+            dinners = roster.fixed[night] or {host: [host] for host in hosts}
+            self.hosts.append(list(dinners))
+            self.start_seats.append([roster.space[h] - sum(roster.size[a] for a in attendees)
+                                     for h, attendees in dinners.items()])
+            self.start_members.append([sum(1 << a for a in attendees) for attendees in dinners.values()])
+            self.start_counts.append([len(attendees) for attendees in dinners.values()])
+            self.guests.append([] if None != roster.fixed[night] else
+                               [f for f in roster.attendees[night] if f not in dinners])
+            self.host_bits.append(sum(1 << host for host in dinners))
+        self.seats = [list(seats) for seats in self.start_seats]
+        self.members = [list(members) for members in self.start_members]
+        self.counts = [list(counts) for counts in self.start_counts]
+        self.order = [list(range(len(hosts))) for hosts in self.hosts]
+        self.seated = [[-1]*roster.count for _ in self.hosts]
+
+    # fills the dinners again like fill_schedule, but with each guest trying the hosts from a random
+    # place in an order shuffled once a night rather than in a new shuffle for every guest
+    def fill(self):
+        roster = self.roster
+        size = roster.size
+        compatible = roster.compatible
+        conflicts = roster.conflicts
+        for night in roster.free_nights:
+            seats = self.seats[night]
+            members = self.members[night]
+            counts = self.counts[night]
+            seats[:] = self.start_seats[night]
+            members[:] = self.start_members[night]
+            counts[:] = self.start_counts[night]
+            hosts = self.hosts[night]
+            order = self.order[night]
+            seated = self.seated[night]
+            guests = self.guests[night]
+            random.shuffle(order)
+            random.shuffle(guests)
+            slots = len(order)
+            for guest in guests:
+                seated[guest] = -1
+                if not slots:
+                    continue
+                need = size[guest]
+                row = compatible[guest]
+                conflict = conflicts[guest]
+                offset = random.randrange(slots)
+                for i in range(slots):
+                    slot = order[(offset + i) % slots]
+                    if need <= seats[slot] and row >> hosts[slot] & 1 and not conflict & members[slot]:
+                        seats[slot] -= need
+                        members[slot] |= 1 << guest
+                        counts[slot] += 1
+                        seated[guest] = slot
+                        break
+
+    # the guest_objective of the current fill
+    def score(self):
+        roster = self.roster
+        score = 0
+        meals = 0
+        dinners = [[] for _ in range(roster.count)]
+        for night, hosts in enumerate(self.hosts):
+            members = self.members[night]
+            for slot, count in enumerate(self.counts[night]):
+                meals += count
+                score -= seat_penalty(roster.space[hosts[slot]], count)
+            for slot, host in enumerate(hosts):
+                dinners[host].append(members[slot])
+            if None != roster.fixed[night]:
+                for slot, attendees in enumerate(roster.fixed[night].values()):
+                    for family in attendees[1:]:
+                        dinners[family].append(members[slot])
+            else:
+                seated = self.seated[night]
+                for guest in self.guests[night]:
+                    if 0 <= seated[guest]:
+                        dinners[guest].append(members[seated[guest]])
+        score += 128 * meals
+        score += meet_score(meet_histogram(roster, dinners))
+
+        # when warm starting take off churn for every family not at the dinner it had
+        if 0 != roster.churn:
+            churn = 0
+            for night in roster.free_nights:
+                hosts = self.hosts[night]
+                seated = self.seated[night]
+                for family in roster.attendees[night]:
+                    previous_seat = roster.previous_seats[night][family]
+                    if None == previous_seat:
+                        continue
+                    if self.host_bits[night] >> family & 1:
+                        seat = family
+                    else:
+                        seat = hosts[seated[family]] if 0 <= seated[family] else None
+                    if previous_seat != seat:
+                        churn += 1
+            score -= roster.churn*churn
+        return score
+
+    # a copy of where the guests are seated, for schedule
+    def snapshot(self):
+        return [list(seated) for seated in self.seated]
+
+    # the schedule of a snapshot
+    def schedule(self, snapshot):
+        schedule = []
+        for night, hosts in enumerate(self.hosts):
+            if None != self.roster.fixed[night]:
+                schedule.append({host: list(attendees) for host, attendees in self.roster.fixed[night].items()})
+                continue
+            dinners = {host: [host] for host in hosts}
+            for guest in self.guests[night]:
+                if 0 <= snapshot[night][guest]:
+                    dinners[hosts[snapshot[night][guest]]].append(guest)
+            schedule.append(dinners)
+        return schedule
+
+# the value of two strangers meeting a given number of times, see score_guest
+def meet_value(times):
+    if 0 == times:
+        return 0
+    return 2-(1/times)
+
+# the penalty score_guest gives a dinner for its empty seats
+def seat_penalty(space, attend_count):
+    extra_seats = space - attend_count
+    if 1 < extra_seats:
+        return 2**(extra_seats)
+    return 0
+
+# the number of guests not at the dinner they had in the previous schedule on the free nights
+def guest_churn(roster, schedule):
+    if None == roster.previous:
+        return 0
+    churn = 0
+    for night in roster.free_nights:
+        seats = {family: host for host, attendees in schedule[night].items() for family in attendees}
+        for family in roster.attendees[night]:
+            previous_seat = roster.previous_seats[night][family]
+            if None != previous_seat and previous_seat != seats.get(family):
+                churn += 1
+    return churn
+
+# what the guest searches maximize, score_guest less the cost of changing the previous schedule
+def guest_objective(roster, schedule):
+    return score_guest(roster, schedule) - roster.churn*guest_churn(roster, schedule)
+
+# the guest schedule a search starts from, the best one from the cache (see main) if it has the same
+# hosts, a random fill or when warm starting everyone that still fits at the dinner they had in the
+# previous schedule (and anyone else GuestSearch.repair can seat)
+def first_guest_schedule(args, roster, host_schedule):
+    if None != args.guest_start and \
+            all(hosts.keys() == start.keys() for hosts, start in zip(host_schedule, args.guest_start)):
+        return [{host: list(attendees) for host, attendees in hosts.items()} for hosts in args.guest_start]
+    if None == roster.previous:
+        return fill_schedule(roster, host_schedule)
+    search = GuestSearch(roster, [{host: [host] for host in hosts} if None == fixed else
+                                  {host: list(attendees) for host, attendees in fixed.items()}
+                                  for hosts, fixed in zip(host_schedule, roster.fixed)])
+    for night in roster.free_nights:
+        for host, attendees in roster.previous[night].items():
+            for guest in attendees[1:]:
+                if None == search.seated[night][guest] and host in search.schedule[night] and \
+                        search.fits(guest, night, host):
+                    search.move(guest, night, None, host)
+    search.repair()
+    return search.schedule
+
+# A local search over the guests of a filled schedule.
+#
+# Instead of refilling and rescoring the whole season every iteration this keeps the schedule live
+# along with who is seated where, how many seats each host has left and how many times every pair
+# of families has met. Each move (seating a starved guest, moving a guest to another dinner or
+# swapping two guests on the same night) is then scored by only looking at the dinners it touches.
+class GuestSearch:
+    def __init__(self, roster, schedule):
+        self.roster = roster
+        self.schedule = schedule
+        self.nights = range(len(schedule))
+
+        # seated[night] is indexed by family and holds the host they are eating with (or None)
+        self.seated = [[None]*roster.count for _ in self.nights]
+        # seats[night] is indexed by host and holds the number of seats they have left
+        self.seats = [[0]*roster.count for _ in self.nights]
+        # members[night] is indexed by host and holds the bits of the families at their dinner
+        self.members = [[0]*roster.count for _ in self.nights]
+        # guests[night] is every family that attends but does not host that night
+        self.guests = [[f for f in roster.attendees[night] if f not in schedule[night]]
+                       for night in self.nights]
+        self.hosts = [list(hosts) for hosts in schedule]
+
+        for night in self.nights:
+            for host, attendees in schedule[night].items():
+                self.seats[night][host] = roster.space[host] - sum(roster.size[a] for a in attendees)
+                for family in attendees:
+                    self.seated[night][family] = host
+                    self.members[night][host] |= 1 << family
+
+        # meets is keyed by family then match and holds the number of times they have met
+        self.meets = {}
+        for hosts in schedule:
+            for attendees in hosts.values():
+                for family in attendees:
+                    meets = self.meets.setdefault(family, {})
+                    for match in attendees:
+                        meets[match] = 1 + meets.get(match, 0)
+
+        self.score = guest_objective(roster, schedule)
+
+        # when set every change is added to the journal as how to undo it, see JointSearch
+        self.journal = None
+
+    # checks if a guest can be added to a dinner, ignoring the seats of leaving
+    def fits(self, guest, night, host, leaving=None):
+        roster = self.roster
+        if not roster.compatible[guest] >> host & 1:
+            return False
+        seats = self.seats[night][host]
+        members = self.members[night][host]
+        if None != leaving:
+            seats += roster.size[leaving]
+            members &= ~(1 << leaving)
+        return roster.size[guest] <= seats and not roster.conflicts[guest] & members
+
+    # changes how many times two families have met and returns the change in score
+    def meet(self, family, match, change):
+        meets = self.meets.setdefault(family, {})
+        times = meets.get(match, 0)
+        meets[match] = times + change
+        if family != match:
+            self.meets.setdefault(match, {})[family] = times + change
+        if not self.roster.strangers[family] >> match & 1:
+            return 0
+        delta = meet_value(times + change) - meet_value(times)
+        if family == match:
+            return delta
+        return 2*delta
+
+    # moves a guest from one dinner to another (either can be None for unseated) and returns the
+    # change in score
+    def move(self, guest, night, src, dst):
+        roster = self.roster
+        if None != self.journal:
+            self.journal.append((self.move, (guest, night, dst, src)))
+        delta = 0
+        if None != src:
+            attendees = self.schedule[night][src]
+            delta += seat_penalty(roster.space[src], len(attendees))
+            attendees.remove(guest)
+            delta -= seat_penalty(roster.space[src], len(attendees))
+            self.seats[night][src] += roster.size[guest]
+            self.members[night][src] &= ~(1 << guest)
+            self.seated[night][guest] = None
+            for other in attendees:
+                delta += self.meet(guest, other, -1)
+        else:
+            delta += 128 + self.meet(guest, guest, 1)
+
+        if None != dst:
+            attendees = self.schedule[night][dst]
+            for other in attendees:
+                delta += self.meet(guest, other, 1)
+            delta += seat_penalty(roster.space[dst], len(attendees))
+            attendees.append(guest)
+            delta -= seat_penalty(roster.space[dst], len(attendees))
+            self.seats[night][dst] -= roster.size[guest]
+            self.members[night][dst] |= 1 << guest
+            self.seated[night][guest] = dst
+        else:
+            delta -= 128 - self.meet(guest, guest, -1)
+
+        # when warm starting guests staying where they were is worth churn, see guest_churn
+        if 0 != roster.churn:
+            previous_seat = roster.previous_seats[night][guest]
+            if None != previous_seat:
+                delta += roster.churn*((previous_seat == dst) - (previous_seat == src))
+
+        self.score += delta
+        return delta
+
+    # makes a family that isn't seated the host of a new dinner and returns the change in score
+    def open(self, host, night):
+        roster = self.roster
+        if None != self.journal:
+            self.journal.append((self.close, (host, night)))
+        self.schedule[night][host] = [host]
+        self.hosts[night].append(host)
+        self.guests[night].remove(host)
+        self.seats[night][host] = roster.space[host] - roster.size[host]
+        self.members[night][host] = 1 << host
+        self.seated[night][host] = host
+
+        delta = 128 + self.meet(host, host, 1) - seat_penalty(roster.space[host], 1)
+        if 0 != roster.churn and None != roster.previous_seats[night][host]:
+            delta += roster.churn*(roster.previous_seats[night][host] == host)
+        self.score += delta
+        return delta
+
+    # ends a dinner that only has its host left, who isn't seated after, and returns the change in score
+    def close(self, host, night):
+        roster = self.roster
+        if None != self.journal:
+            self.journal.append((self.open, (host, night)))
+        del self.schedule[night][host]
+        self.hosts[night].remove(host)
+        self.guests[night].append(host)
+        self.seats[night][host] = 0
+        self.members[night][host] = 0
+        self.seated[night][host] = None
+
+        delta = self.meet(host, host, -1) - 128 + seat_penalty(roster.space[host], 1)
+        if 0 != roster.churn and None != roster.previous_seats[night][host]:
+            delta -= roster.churn*(roster.previous_seats[night][host] == host)
+        self.score += delta
+        return delta
+
+    # seats as many starved guests as it can, returning how many were seated
+    def repair(self):
+        repaired = 0
+        for night in self.roster.free_nights:
+            for guest in self.guests[night]:
+                if None == self.seated[night][guest] and self.augment(guest, night):
+                    repaired += 1
+        return repaired
+
+    # Seats a guest by moving other guests along the shortest chain of dinners that ends at one with
+    # room, like an augmenting path in a matching. Each step of the chain is a family that has to
+    # move and the dinner they are leaving, with every dinner used at most once in a chain so each
+    # one only ever loses and gains one family. Returns if the guest was seated.
+    def augment(self, guest, night):
+        roster = self.roster
+        size = roster.size
+        seats = self.seats[night]
+        members = self.members[night]
+        hosts = sorted(self.hosts[night])
+        used = set()
+        # steps are (family, the host they are leaving, the index of the step that moved them out)
+        steps = [(guest, None, None)]
+        for step, (family, src, _) in enumerate(steps):
+            # the dinners the chain so far leaves, another chain's dinners can still end this one
+            chain = set()
+            parent = step
+            while None != parent:
+                chain.add(steps[parent][1])
+                parent = steps[parent][2]
+            compatible = roster.compatible[family]
+            conflicts = roster.conflicts[family]
+            for host in hosts:
+                if host in chain or not compatible >> host & 1:
+                    continue
+                if size[family] <= seats[host] and not conflicts & members[host]:
+                    # make the moves from the end of the chain back to the guest
+                    while None != step:
+                        family, src, parent = steps[step]
+                        self.move(family, night, src, host)
+                        host = src
+                        step = parent
+                    return True
+                if host in used:
+                    continue
+                # any of the dinner's guests that would make room can be the one to move on, though
+                # only one of the guests that are alike (and so could go to the same dinners) is tried
+                need = size[family] - seats[host]
+                alike = set()
+                for other in sorted(self.schedule[night][host]):
+                    if other == host or size[other] < need or conflicts & members[host] & ~(1 << other):
+                        continue
+                    kind = (size[other], roster.compatible[other], roster.conflicts[other])
+                    if kind not in alike:
+                        alike.add(kind)
+                        used.add(host)
+                        steps.append((other, host, step))
+        return False
+
+    # Seats the guests of some of a night's dinners again as well as they can be, with a branch and
+    # bound over which of the dinners each guest goes to (or none). The guests at those dinners and up
+    # to as many starved guests of the night that could go to one of them as there are dinners are
+    # taken out, then put back one at a time, the ones with the fewest dinners to go to first.
+    # Everything else stays where it is so the value of seating a guest is made of its meal and meets
+    # with the host, what each pair of guests would add by meeting there, and the change in the
+    # dinners' seat penalties. A branch is cut when even seating every guest left at their best
+    # dinner, meeting every stranger left and filling the dinners as far as their seats allow couldn't
+    # beat the best seating found, which starts as the one they had. When a night has no more dinners
+    # than are seated again at once this is the best seating of the whole night. Gives up after limit
+    # nodes keeping the best seating found. Returns if the score went up and if the seating found is
+    # the best there is.
+    def reseat(self, night, hosts, limit):
+        roster = self.roster
+        size = roster.size
+        space = roster.space
+        strangers = roster.strangers
+
+        # take the guests out, remembering where they were
+        guests = [g for host in hosts for g in self.schedule[night][host] if g != host]
+        starved = [g for g in self.guests[night] if None == self.seated[night][g] and
+                   any(roster.compatible[g] >> host & 1 for host in hosts)]
+        guests += random.sample(starved, min(len(hosts), len(starved)))
+        before = {g: self.seated[night][g] for g in guests}
+        start_score = self.score
+        for g in guests:
+            self.move(g, night, before[g], None)
+
+        # the value of a guest at each dinner, with a guest left starved worth nothing
+        def gain(family, match):
+            if not strangers[family] >> match & 1:
+                return 0
+            times = self.meets.get(family, {}).get(match, 0)
+            return meet_value(times + 1) - meet_value(times)
+        values = {}
+        for g in guests:
+            previous_seat = roster.previous_seats[night][g] if 0 != roster.churn else None
+            for host in hosts:
+                if roster.compatible[g] >> host & 1:
+                    value = 128 + gain(g, g) + 2*gain(g, host)
+                    if None != previous_seat:
+                        value += roster.churn*((previous_seat == host) - (previous_seat == None))
+                    values[g, host] = value
+        guests.sort(key=lambda g: (sum(1 for host in hosts if (g, host) in values), -size[g], g))
+        pairs = {(g, other): 2*gain(g, other) for g in guests for other in guests if g != other}
+        # what meeting every stranger seated after them could add, for the bound
+        later = [sum(max(0, pairs[g, other]) for other in guests[i + 1:]) for i, g in enumerate(guests)]
+        smallest = [min([size[g] for g in guests[i:]] or [0]) for i in range(len(guests) + 1)]
+
+        seats = {host: self.seats[night][host] for host in hosts}
+        members = {host: self.members[night][host] for host in hosts}
+        counts = {host: len(self.schedule[night][host]) for host in hosts}
+        seating = [None]*len(guests)
+
+        def seated_value(g, host):
+            return values[g, host] + sum(pairs[g, guests[i]] for i in range(len(guests))
+                                         if host == seating[i])
+
+        # the value of the seating they had is where the search starts
+        best_value = 0
+        for host, attendees in ((h, [g for g in guests if before[g] == h]) for h in hosts):
+            best_value += sum(values[g, host] for g in attendees) + \
+                          sum(pairs[g, other] for g in attendees for other in attendees if g < other) + \
+                          seat_penalty(space[host], counts[host]) - \
+                          seat_penalty(space[host], counts[host] + len(attendees))
+        best = [before[g] for g in guests]
+        nodes = 0
+
+        def search(i, value):
+            nonlocal best_value, best, nodes
+            nodes += 1
+            if i == len(guests):
+                if best_value < value:
+                    best_value = value
+                    best = list(seating)
+                return
+            if limit < nodes:
+                return
+
+            # the most the guests left could add
+            bound = value
+            for j in range(i, len(guests)):
+                g = guests[j]
+                bound += max([0] + [seated_value(g, host) for host in hosts
+                                    if (g, host) in values and size[g] <= seats[host]]) + later[j]
+            for host in hosts:
+                if 0 < smallest[i]:
+                    reach = min(len(guests) - i, seats[host]//smallest[i])
+                    bound += seat_penalty(space[host], counts[host]) - \
+                             seat_penalty(space[host], counts[host] + reach)
+            if bound <= best_value:
+                return
+
+            g = guests[i]
+            options = []
+            for host in hosts:
+                if (g, host) in values and size[g] <= seats[host] and not roster.conflicts[g] & members[host]:
+                    options.append((seated_value(g, host) + seat_penalty(space[host], counts[host]) -
+                                    seat_penalty(space[host], counts[host] + 1), host))
+            options.sort(reverse=True)
+            for change, host in options:
+                seating[i] = host
+                seats[host] -= size[g]
+                members[host] |= 1 << g
+                counts[host] += 1
+                search(i + 1, value + change)
+                counts[host] -= 1
+                members[host] &= ~(1 << g)
+                seats[host] += size[g]
+                seating[i] = None
+            search(i + 1, value)
+
+        search(0, 0)
+
+        for g, host in zip(guests, best):
+            self.move(g, night, None, host)
+        return start_score < self.score, nodes <= limit
+
+    # when warm starting only the guests that are not at the dinner they had in the previous
+    # schedule (new families and those whose dinner changed) are moved, the rest keep their seats
+    def movable(self, guest, night):
+        if None == self.roster.previous:
+            return True
+        previous_seat = self.roster.previous_seats[night][guest]
+        return None == previous_seat or previous_seat != self.seated[night][guest]
+
+    # tries a single random move, keeping it if the score does not get worse. When warm starting
+    # only the movable guests on the nights the input changed are moved.
+    def step(self):
+        nights = self.roster.changed_nights
+        if not nights:
+            return False
+        night = random.choice(nights)
+        if not self.guests[night] or not self.hosts[night]:
+            return False
+        guest = random.choice(self.guests[night])
+        src = self.seated[night][guest]
+        dst = random.choice(self.hosts[night])
+        if src == dst or not self.movable(guest, night):
+            return False
+
+        # starved guests and guests moving to a dinner with room just move
+        if self.fits(guest, night, dst):
+            if 0 <= self.move(guest, night, src, dst):
+                return True
+            self.move(guest, night, dst, src)
+            return False
+
+        # otherwise swap with someone at the other dinner
+        if None == src:
+            return False
+        other = random.choice(self.schedule[night][dst])
+        if other == dst or not self.movable(other, night):
+            return False
+        if not self.fits(guest, night, dst, other) or not self.fits(other, night, src, guest):
+            return False
+        delta = self.move(guest, night, src, None) + self.move(other, night, dst, src) + \
+                self.move(guest, night, None, dst)
+        if 0 <= delta:
+            return True
+        self.move(guest, night, dst, None)
+        self.move(other, night, src, dst)
+        self.move(guest, night, None, src)
+        return False
+
+# improves a filled schedule with GuestSearch moves for the specified time
+def search_guests(args, roster, host_schedule, shared=None):
+    log = multiprocessing.get_logger()
+
+    stopper = Stopper(args, roster, args.target_guest, guest_bound(roster))
+    metrics = Metrics('guest')
+    checkpoint = Checkpoint(args, 'guest')
+    last_migration = stopper.start
+
+    since = time.perf_counter()
+    search = GuestSearch(roster, first_guest_schedule(args, roster, host_schedule))
+    search.repair()
+    best_score = search.score
+    stopper.update(best_score, 0)
+    since = metrics.lap('fill', since)
+
+    j = 0
+    k = 0
+    while True:
+        j += 1
+        k += 1
+
+        search.step()
+
+        # print out progress and keep reseting j till we are done
+        if 1000 < j:
+            stepped = since
+            since = metrics.lap('step', since)
+
+            # with --guest_search exact a third as long again is spent seating a few dinners exactly,
+            # which gets out of where single moves are stuck
+            if 'exact' == args.guest_search:
+                until = since + (since - stepped)/3
+                while roster.changed_nights and time.perf_counter() < until:
+                    night = random.choice(roster.changed_nights)
+                    hosts = search.hosts[night]
+                    search.reseat(night, random.sample(hosts, min(args.exact_hosts, len(hosts))),
+                                  args.exact_nodes)
+                since = metrics.lap('reseat', since)
+
+            if best_score < search.score:
+                best_score = search.score
+                stopper.update(best_score, k)
+                if log.isEnabledFor(logging.INFO):
+                    summery(roster, search.schedule)
+                    log.info("Optimize runs: " + str(k))
+                    log.info("Optimize score: " + str(best_score))
+            if stopper.done(k):
+                break
+            else:
+                j = 0
+            checkpoint.save(search.score, search.schedule)
+
+            # swap with the other workers, carrying on from the shared best when it is better
+            if None != shared and args.migration < time.time() - last_migration:
+                last_migration = time.time()
+                adopted = shared.migrate(search.score, search.schedule)
+                if None != adopted:
+                    search = GuestSearch(roster, adopted[1])
+                    best_score = search.score
+                    stopper.update(best_score, k)
+                    log.info("Optimize migrated score: " + str(best_score))
+            since = metrics.lap('migrate', since)
+
+    log.warning("Optimize runs: %d in %.3f seconds" % (k, time.time() - stopper.start))
+
+    return search.schedule, metrics.report(stopper, k)
+
 # this takes an existing host schedule and iterates on it to find the best mixing of guests
-def optimize_schedule(args, families, host_schedule, schedules):
+def optimize_schedule(args, roster, host_schedule, schedules, shared=None):
     log = multiprocessing.get_logger()
 
-    start_time = time.time()
+    stopper = Stopper(args, roster, args.target_guest, guest_bound(roster))
+    metrics = Metrics('guest')
+    checkpoint = Checkpoint(args, 'guest')
+    last_migration = stopper.start
 
-    current_schedule = fill_schedule(families, host_schedule)
-    current_score = score_guest(current_schedule)
+    since = time.perf_counter()
+    current_schedule = first_guest_schedule(args, roster, host_schedule)
+    current_score = guest_objective(roster, current_schedule)
+    stopper.update(current_score, 0)
+    seating = Seating(roster, host_schedule)
+    since = metrics.lap('fill', since)
 
-    # loop whatever number of times you would like
-    # TODO: make this a bit more intellegent, maybe loop till you haven't found a better solution
-    #           in 10k runs or something
+    # loop till the stopper says we are done
     j = 0
     k = 0
     while True:
         j += 1
         k += 1
 
-        new_schedule = fill_schedule(families, host_schedule)
-        new_score = score_guest(new_schedule)
+        seating.fill()
+        since = metrics.lap('fill', since)
+        new_score = seating.score()
+        since = metrics.lap('score', since)
         if current_score < new_score:
-            current_schedule = new_schedule
+            current_schedule = seating.schedule(seating.snapshot())
             current_score = new_score
+            stopper.update(current_score, k)
 
             # print out progress
-            summery(current_schedule)
-            log.info("Optimize runs: " + str(k))
-            log.info("Optimize score: " + str(current_score))
-
-        # keep reseting j till we have ran for the specified time
-        if 1000 < j:
-            if args.time < time.time() - start_time:
+            if log.isEnabledFor(logging.INFO):
+                summery(roster, current_schedule)
+                log.info("Optimize runs: " + str(k))
+                log.info("Optimize score: " + str(current_score))
+
+        # keep reseting j till we are done, a fill of a big roster takes long enough to also check
+        # the deadline every time
+        if 1000 < j or stopper.deadline < time.time():
+            if stopper.done(k):
                 break
             else:
                 j = 0
+            checkpoint.save(current_score, current_schedule)
+
+            # swap with the other workers
+            if None != shared and args.migration < time.time() - last_migration:
+                last_migration = time.time()
+                adopted = shared.migrate(current_score, current_schedule)
+                if None != adopted:
+                    current_score, current_schedule = adopted
+                    stopper.update(current_score, k)
+            since = metrics.lap('migrate', since)
 
-    log.warning("Optimize runs: " + str(k))
+    log.warning("Optimize runs: %d in %.3f seconds" % (k, time.time() - stopper.start))
 
-    return current_schedule
+    return current_schedule, metrics.report(stopper, k)
 
-# Optimizes a given schedule
-def optimize_schedule_process(args, families, host_schedule, schedules):
-    schedule = optimize_schedule(args, families, host_schedule, schedules)
-    schedules.put(schedule)
+# Optimizes a given schedule in a process, sending back the packed schedule with its guest_objective
+def optimize_schedule_process(args, roster, host_schedule, schedules, shared=None):
+    if args.guest_search in ('local', 'exact'):
+        schedule, record = profiled(args, 'guest', search_guests, args, roster, host_schedule, shared)
+    else:
+        schedule, record = profiled(args, 'guest', optimize_schedule, args, roster, host_schedule, schedules,
+                                    shared)
+    schedules.put((guest_objective(roster, schedule), pack_schedule(schedule), record))
+
+# Runs the host and guest searches at the same time instead of one after the other.
+#
+# Half the workers (at least one) search for hosts and send every new best host schedule that seats
+# everyone to the main process, which keeps the --top best different ones and hands each new one to
+# the next worker that is free to optimize its guests for a slice of the guest time. Host workers
+# join in on the guests once their search is done, and once every host candidate has had its slice
+# the free workers carry on improving the best results so far until --time is up. The schedule kept
+# is the one with the best combined_score, so a host schedule that scores a little worse but seats
+# its guests much better wins. Returns the schedule and when the host searches finished.
+def run_pipeline(args, roster, shared, records):
+    events = multiprocessing.Queue()
+    work = multiprocessing.Queue()
+    deadline = args.deadline
+    guest_slice = (1 - args.host_share)*args.time/max(1, args.top)
+
+    host_workers = max(1, args.processes//2)
+    args.deadline = deadline - (1 - args.host_share)*args.time
+    processes = []
+    for i in range(args.processes):
+        p = multiprocessing.Process(target=pipeline_process,
+                                    args=(args, roster, i < host_workers, events, work, shared,))
+        processes.append(p)
+        p.start()
+
+    # the schedules here are all packed (see pack_schedule), and the workers send what they are
+    # ranked by, which puts the schedules that can seat more people first and then the best scores
+    top = []        # the best host candidates as ((-host_shortfall, score), hosts, schedule), best first
+    tried = set()   # the hosts of the candidates that have been handed out
+    results = []    # the guest results as [(-starved, combined_score), schedule, carried on with], best first
+    hosts_done = 0
+    host_time = None
+    idle = 0
+    stopped = 0
+    while stopped < args.processes:
+        event = events.get()
+        if 'candidate' == event[0] or 'host' == event[0]:
+            hosts = tuple(frozenset(night) for night in unpack_schedule(event[2]))
+            if hosts not in tried and all(hosts != other for _, other, _ in top):
+                top.append((event[1], hosts, event[2]))
+                top.sort(key=lambda t: t[0], reverse=True)
+                del top[args.top:]
+            if 'host' == event[0]:
+                records.append(event[3])
+                hosts_done += 1
+                if hosts_done == host_workers:
+                    host_time = time.time()
+        elif 'guest' == event[0]:
+            results.append([event[1], event[2], event[4]])
+            results.sort(key=lambda r: r[0], reverse=True)
+            records.append(event[3])
+            idle += 1
+        else:
+            idle += 1
+
+        # give every free worker the best candidate that hasn't had a slice, or once the host
+        # searches are done the best result that hasn't been carried on with, otherwise wait for
+        # more candidates or let them go when there is nothing left to do
+        while 0 < idle:
+            untried = [t for t in top if t[1] not in tried]
+            again = [r for r in results if not r[2]]
+            if time.time() < deadline and untried:
+                tried.add(untried[0][1])
+                work.put((untried[0][2], None, min(deadline, time.time() + guest_slice)))
+            elif time.time() < deadline and hosts_done == host_workers and again:
+                again[0][2] = True
+                hosts = [{host: [host] for host in dinners} for dinners in unpack_schedule(again[0][1])]
+                work.put((pack_schedule(hosts), again[0][1], deadline))
+            elif time.time() < deadline and hosts_done < host_workers:
+                break
+            else:
+                work.put(None)
+                stopped += 1
+            idle -= 1
+
+    for p in processes:
+        p.join()
+    args.deadline = deadline
+
+    if not results:
+        return fill_schedule(roster, unpack_schedule(top[0][2])), host_time
+    return unpack_schedule(results[0][1]), host_time
+
+# a worker for run_pipeline, searching for hosts first if it is a host worker and then optimizing the
+# guests of whatever it is handed until it is handed None
+def pipeline_process(args, roster, host, events, work, shared=None):
+    if host:
+        # only schedules that can seat everyone are published
+        publish = lambda score, schedule: events.put(('candidate', (0, score), pack_schedule(schedule)))
+        search = search_hosts if 'anneal' == args.host_search else find_schedule
+        schedule, record = profiled(args, 'host', search, args, roster, shared, publish)
+        events.put(('host', (-host_shortfall(roster, schedule), host_objective(roster, schedule)),
+                    pack_schedule(schedule), record))
+    events.put(('ready',))
+
+    while True:
+        item = work.get()
+        if None == item:
+            return
+        host_schedule, guest_start, args.deadline = item
+        host_schedule = unpack_schedule(host_schedule)
+        args.guest_start = None if None == guest_start else unpack_schedule(guest_start)
+        if args.guest_search in ('local', 'exact'):
+            schedule, record = profiled(args, 'guest', search_guests, args, roster, host_schedule)
+        else:
+            schedule, record = profiled(args, 'guest', optimize_schedule, args, roster, host_schedule, None)
+        events.put(('guest', (-starved_meals(roster, schedule), combined_score(roster, schedule)),
+                    pack_schedule(schedule), record, None != guest_start))
+
+# what the pipeline and the joint search pick schedules by, the host and guest objectives added
+# together with the host objective weighted by host_weight
+def combined_score(roster, schedule, host_weight=1):
+    return host_weight*host_objective(roster, schedule) + guest_objective(roster, schedule)
+
+# Splits the families into count partitions that can be scheduled on their own.
+#
+# Families are dealt out one at a time, the families that can offer the most seats first and then
+# the biggest guests, each to the partition (with room under an even share of the families) where
+# they do the most good: hosts go where the nights they can host are shortest of seats and guests
+# where the nights they attend have the most seats to spare, counting every possible host's free
+# seats against every guest. Partitions holding a family they repel are avoided first, and ones
+# holding families they know (whose meets don't score) are avoided last.
+def partition_families(roster, count):
+    count = max(1, min(count, roster.count))
+    limit = -(-roster.count // count)
+    members = [[] for _ in range(count)]
+    bits = [0]*count
+    seats = [[0]*roster.nights for _ in range(count)]
+
+    order = sorted(range(roster.count), key=lambda f: (
+            -(roster.space[f] - roster.size[f])*roster.host[f].bit_count(), -roster.size[f], f))
+    for family in order:
+        nights = [night for night in range(roster.nights) if roster.attend[family] >> night & 1]
+        sign = 1 if roster.host[family] else -1
+        best = None
+        for p in range(count):
+            if limit <= len(members[p]):
+                continue
+            cost = ((roster.conflicts[family] & bits[p]).bit_count(),
+                    sign*sum(seats[p][night] for night in nights),
+                    (~roster.strangers[family] & bits[p]).bit_count(),
+                    len(members[p]))
+            if None == best or cost < best[0]:
+                best = (cost, p)
+
+        p = best[1]
+        members[p].append(family)
+        bits[p] |= 1 << family
+        for night in nights:
+            if roster.host[family] >> night & 1:
+                seats[p][night] += roster.space[family] - roster.size[family]
+            else:
+                seats[p][night] -= roster.size[family]
+    return members
+
+# Schedules the families in partitions (see partition_families) in parallel and then improves the
+# whole schedule. Each partition gets its own Roster and a host search and a guest search in a pool
+# worker, each search only ever touching the families of its partition, so the work grows with the
+# number of families instead of faster. The partitions' schedules are then put together and the
+# guest local search is run over all of them for --refine_share of the time, where it can move
+# guests to dinners in other partitions, or the joint search if that can't seat everyone the
+# partitions starved. Returns the schedule.
+def run_partitions(args, roster, records):
+    deadline = args.deadline
+    partitions = partition_families(roster, args.partitions)
+    waves = -(-len(partitions) // args.processes)
+    slot = (1 - args.refine_share)*(deadline - time.time())/waves
+
+    with multiprocessing.Pool(min(args.processes, len(partitions))) as pool:
+        results = pool.starmap(partition_process, [(args, [roster.families[f] for f in members], slot)
+                                                   for members in partitions])
+
+    schedule = [{} for _ in range(roster.nights)]
+    for packed, partition_records in results:
+        records += partition_records
+        for night, hosts in enumerate(unpack_schedule(packed)):
+            schedule[night].update(hosts)
+
+    # then refine across the partitions, with the joint search when the partitions left families that
+    # moving guests can't seat, as it can also open and close dinners
+    args.deadline = deadline
+    search = GuestSearch(roster, schedule)
+    search.repair()
+    args.guest_start = search.schedule
+    if 0 < starved_meals(roster, search.schedule):
+        log = multiprocessing.get_logger()
+        log.warning("The partitions can't seat %d family-meals, refining with the joint search" %
+                    starved_meals(roster, search.schedule))
+        schedule, record = search_joint(args, roster)
+    else:
+        schedule, record = search_guests(args, roster, [{host: [host] for host in hosts} for hosts in schedule])
+    records.append(record)
+    return schedule
+
+# schedules one partition's families for run_partitions in a pool worker, sending back the schedule
+# packed with the indexes of the whole roster
+def partition_process(args, members, slot):
+    start = time.time()
+    args = copy.copy(args)
+    args.cache = None
+    args.host_start = None
+    args.guest_start = None
+
+    # a roster of copies of the families, indexed within the partition
+    families = []
+    tags = {}
+    for index, member in enumerate(members):
+        family = copy.copy(member)
+        family.compact(index, tags)
+        families.append(family)
+    roster = Roster(families)
+
+    schedule, partition_records = run_phases(args, roster, start, slot)
+    schedule = [{members[host].index: [members[a].index for a in attendees] for host, attendees in hosts.items()}
+                for hosts in schedule]
+    return pack_schedule(schedule), partition_records
+
+# runs the host search and then the guest search in this process, the host search for --host_share
+# of the slot of seconds from start, returning the schedule and the records of both (or with --joint
+# the joint search for the whole slot). When given progress is called with the phase and score of
+# each new best.
+def run_phases(args, roster, start, slot, progress=None):
+    if args.joint:
+        args.deadline = start + slot
+        if None != progress:
+            args.notify = lambda score: progress('joint', score)
+        schedule, record = search_joint(args, roster)
+        args.notify = None
+        return schedule, [record]
+    args.deadline = start + args.host_share*slot
+    if None != progress:
+        args.notify = lambda score: progress('host', score)
+    if 'anneal' == args.host_search:
+        host_schedule, host_record = search_hosts(args, roster)
+    else:
+        host_schedule, host_record = find_schedule(args, roster)
+    args.deadline = start + slot
+    if None != progress:
+        args.notify = lambda score: progress('guest', score)
+    if args.guest_search in ('local', 'exact'):
+        schedule, guest_record = search_guests(args, roster, host_schedule)
+    else:
+        schedule, guest_record = optimize_schedule(args, roster, host_schedule, None)
+    args.notify = None
+    return schedule, [host_record, guest_record]
+
+# the options set in args that run_phases doesn't act on, as main does them itself, so the scripts
+# that search with run_phases can turn them down
+def main_only_options(parser, args):
+    names = ['processes', 'pipeline', 'top', 'partitions', 'refine_share', 'previous', 'freeze', 'churn',
+             'cache', 'checkpoint', 'resume', 'metrics', 'profile']
+    return ['--' + name for name in names if parser.get_default(name) != getattr(args, name)]
+
+# the family-meals in schedule that nobody is serving
+def starved_meals(roster, schedule):
+    starved = 0
+    for night, hosts in enumerate(schedule):
+        seated = set()
+        for attendees in hosts.values():
+            seated.update(attendees)
+        starved += sum(1 for family in roster.attendees[night] if family not in seated)
+    return starved
 
 # counts the number of requested meals
 def count_meals(families):
@@ -490,28 +2790,26 @@ def count_meals(families):
         meals += family.attend_nights.count(True)
     return meals
 
-def find_starved_family(families, schedule):
+def find_starved_family(roster, schedule):
 
     log = multiprocessing.get_logger()
 
     starved_count = 0
 
-    for family in families:
-        for night in range(len(family.attend_nights)):
-            if not family.attend_nights[night]:
-                continue
-            served = False
-            for host in schedule[night]:
-                if family in schedule[night][host]:
-                    served = True
-            if not served:
-                log.warning(family.email + " not served night # " + str(night))
+    for night in range(roster.nights):
+        served = set()
+        for attendees in schedule[night].values():
+            served.update(attendees)
+        for family in roster.attendees[night]:
+            if family not in served:
+                log.warning(roster.families[family].email + " not served night # " + str(night))
                 starved_count += 1
 
     if 0 != starved_count:
         log.warning("%d Family-meals starved" % (starved_count))
 
-def main():
+# the arguments of main, shared with sweep.py
+def argument_parser():
     parser = argparse.ArgumentParser(
             description='Creates a Schedule for Salt shaker dinners'
             )
@@ -521,8 +2819,89 @@ def main():
                         help="Set the logging level", default='WARNING')
     parser.add_argument("-p", "--processes", type=int)
     parser.add_argument("-s", "--max_dinner_size", default=8, type=int, help="The maximum size of a single dinner including the host")
-    parser.add_argument("-t", "--time", default=120, type=int, help="The time to run in seconds")
+    parser.add_argument("-t", "--time", default=120, type=float,
+                        help="The most time to run in seconds, shared by the host and guest searches")
+    parser.add_argument("--host_share", default=0.5, type=float,
+                        help="The most of --time the host search may use, the guest search gets the rest")
+    parser.add_argument("--stall_runs", type=int,
+                        help="Stop a search after this many runs without improving, 0 to not, by default "
+                             "more the more families there are")
+    parser.add_argument("--stall_time", default=0, type=float,
+                        help="Stop a search after this many seconds (plus the time it took to reach its "
+                             "last improvement) without improving, 0 to not")
+    parser.add_argument("--target_host", type=float, help="Stop the host search once it reaches this score")
+    parser.add_argument("--target_guest", type=float, help="Stop the guest search once it reaches this score")
+    parser.add_argument("--gap", type=float,
+                        help="Stop the guest and joint searches once their score is within this fraction of "
+                             "the upper bound on it, the bound on the host score is too loose to stop on")
+    parser.add_argument("-a", "--host_search", choices=['restart', 'anneal', 'sample'], default='restart',
+                        help="How to search for hosts: restarting generation, annealing one schedule or "
+                             "sampling from what the best schedules so far have in common")
+    parser.add_argument("-b", "--batch", default=64, type=int,
+                        help="The number of host schedules to generate and score together when restarting")
+    parser.add_argument("--elite", default=0.1, type=float,
+                        help="The share of each batch the sample host search learns from")
+    parser.add_argument("--learning_rate", default=0.2, type=float,
+                        help="How far the sample host search moves towards each batch's elite")
+    parser.add_argument("--temperature", default=8.0, type=float,
+                        help="The starting temperature when annealing hosts")
+    parser.add_argument("--slack", default=0.25, type=float,
+                        help="The free seats per dinner annealing hosts leaves each night, as families can't be "
+                             "split between dinners")
+    parser.add_argument("-m", "--migration", default=2.0, type=float,
+                        help="Seconds between workers sharing their best schedules, 0 to keep them apart")
+    parser.add_argument("-g", "--guest_search", choices=['local', 'restart', 'exact'], default='local',
+                        help="How to search for guests: local moves on one schedule, restarting fills or "
+                             "local moves with dinners seated again exactly")
+    parser.add_argument("--exact_hosts", default=3, type=int,
+                        help="The number of dinners the exact guest search seats again at once")
+    parser.add_argument("--exact_nodes", default=20000, type=int,
+                        help="The most branches the exact guest search tries before keeping the best found")
+    parser.add_argument("--joint", action='store_true',
+                        help="Search for hosts and guests together for the whole time instead of one after the "
+                             "other, keeping the schedule with the best combined_score")
+    parser.add_argument("--host_weight", default=1.0, type=float,
+                        help="How much the host score counts against the guest score in the joint search")
+    parser.add_argument("--joint_moves", default=0.1, type=float,
+                        help="The share of the joint search's steps that change the hosts")
+    parser.add_argument("--pipeline", action='store_true',
+                        help="Search for guests while the hosts are still being searched, trying the best --top host schedules")
+    parser.add_argument("-k", "--top", default=4, type=int,
+                        help="With --pipeline, the number of best host schedules to optimize the guests of")
+    parser.add_argument("--partitions", default=1, type=int,
+                        help="Split the families into this many partitions to schedule on their own, for large inputs")
+    parser.add_argument("--refine_share", default=0.2, type=float,
+                        help="With --partitions, the share of --time spent improving the whole schedule afterwards")
+    parser.add_argument("--previous",
+                        help="Start from this earlier output instead of a blank schedule, for when the input has "
+                             "changed (restarts only generate the nights the input changed again)")
+    parser.add_argument("--freeze", default=0, type=int,
+                        help="With --previous, the number of nights already published that must not change")
+    parser.add_argument("--churn", default=1.0, type=float,
+                        help="With --previous, the score lost for each host or guest moved from where they were. "
+                             "Only the nights the input changed are searched again, where this is small next to "
+                             "the ratio penalty of the host score so it mostly breaks ties between hosts")
+    parser.add_argument("--cache",
+                        help="Keep the best schedule for each input in this directory and start from it when run "
+                             "again, along with the workers' checkpoints")
+    parser.add_argument("--checkpoint", default=30, type=float,
+                        help="With --cache, seconds between each worker saving its best schedule, 0 to not")
+    parser.add_argument("--resume", action='store_true',
+                        help="With --cache, start from the checkpoints of a run that was cut short")
+    parser.add_argument("--metrics",
+                        help="Write what each worker did to this file, as CSV if it ends in .csv and JSON Lines otherwise")
+    parser.add_argument("--profile", help="Profile each worker's searches, saving the stats in this directory")
+    # what the searches tell about each new best (see Stopper) and where they start from (see main)
+    parser.set_defaults(notify=None, cache_key=None, host_start=None, guest_start=None)
+    return parser
+
+def main():
+    parser = argument_parser()
     args = parser.parse_args()
+    if 1 < args.partitions and (None != args.previous or args.pipeline):
+        parser.error('--partitions can not be used with --previous or --pipeline')
+    if args.joint and (args.pipeline or 1 < args.partitions):
+        parser.error('--joint can not be used with --pipeline or --partitions')
 
     # setup logger
     log = multiprocessing.log_to_stderr(level=getattr(logging, args.logLevel))
@@ -540,7 +2919,48 @@ def main():
     if None != cpu_count and cpu_count < args.processes:
         log.warning('%d processes requested, system only reports %d cpus' % (args.processes, cpu_count))
 
+    if None != args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    start_time = time.time()
+
     families = read_csv(args.input, args.max_dinner_size)
+    roster = Roster(families)
+    if None != args.previous:
+        roster.warm_start(read_schedule(args.previous, roster), args.freeze, args.churn)
+    records = []
+
+    # start from the best schedule found for this input before, and with --resume from the best
+    # schedules saved by the workers of a run that was cut short
+    args.cache_key = None
+    args.host_start = None
+    args.guest_start = None
+    cached = None
+    resumed = None
+    if None != args.cache:
+        os.makedirs(args.cache, exist_ok=True)
+        args.cache_key = cache_key(roster)
+        cached = load_pickle(os.path.join(args.cache, args.cache_key + '.pickle'))
+        if None != cached:
+            log.warning("Starting from the cached schedule")
+            args.host_start = cached[2]
+            args.guest_start = cached[2]
+        if args.resume:
+            checkpoints = {}
+            for phase in ('host', 'guest'):
+                saved = [load_pickle(filename) for filename in
+                         glob.glob(os.path.join(args.cache, '%s-%s-*.pickle' % (args.cache_key, phase)))]
+                checkpoints[phase] = max(saved, key=lambda s: s[0], default=None)
+            if None != checkpoints['host'] and (None == cached or cached[0] < checkpoints['host'][0]):
+                log.warning("Resuming the host search")
+                args.host_start = checkpoints['host'][1]
+            if None != checkpoints['guest']:
+                log.warning("Resuming the guest search")
+                args.guest_start = checkpoints['guest'][1]
+                resumed = args.guest_start
+
+    # the host search gets its share of the time, the guest search whatever is left
+    args.deadline = start_time + args.host_share*args.time
 
     schedules = []
     processes = []
@@ -548,59 +2968,125 @@ def main():
     schedule_q = multiprocessing.Queue()
 
 
-    if 1 < args.processes:
-        for i in range(args.processes):
-            p = multiprocessing.Process(target=find_schedule_process, args=(args, families, schedule_q,))
-            processes.append(p)
-            p.start()
-
-        for p in processes:
+    # workers share their best schedules unless migration is turned off
+    shared = None
+    if 1 < args.processes and 0 < args.migration:
+        shared = SharedBest(roster)
+
+    if args.pipeline:
+        args.deadline = start_time + args.time
+        schedule, host_time = run_pipeline(args, roster, shared, records)
+        guest_time = time.time()
+    elif 1 < args.partitions:
+        args.deadline = start_time + args.time
+        schedule = run_partitions(args, roster, records)
+        host_time = guest_time = time.time()
+    elif args.joint:
+        # one phase for the whole time
+        args.deadline = start_time + args.time
+        if 1 < args.processes:
+            for i in range(args.processes):
+                p = multiprocessing.Process(target=joint_process, args=(args, roster, schedule_q, shared,))
+                processes.append(p)
+                p.start()
+            for p in processes:
+                schedules.append(schedule_q.get())
+            for p in processes:
+                p.join()
+        else:
+            joint_process(args, roster, schedule_q)
             schedules.append(schedule_q.get())
-            p.join
+        records += [record for _, _, record in schedules]
+        schedule = unpack_schedule(max(schedules, key=lambda s: s[0])[1])
+        host_time = guest_time = time.time()
     else:
-        find_schedule_process(args, families, schedule_q)
-        schedules.append(schedule_q.get())
-
-    # find the best schedule from the threads
-    schedule = schedules[0]
-    current_score = score_host(schedule)
-    for new_schedule in schedules:
-        new_score = score_host(new_schedule)
-        if current_score < new_score:
-            schedule = new_schedule
-            current_score = new_score
+        if None != resumed:
+            # the host search had finished before the run was cut short so carry on with the guests
+            schedule = [{host: [host] for host in hosts} for hosts in resumed]
+        else:
+            if 1 < args.processes:
+                for i in range(args.processes):
+                    p = multiprocessing.Process(target=find_schedule_process, args=(args, roster, schedule_q, shared,))
+                    processes.append(p)
+                    p.start()
+
+                for p in processes:
+                    schedules.append(schedule_q.get())
+                for p in processes:
+                    p.join()
+            else:
+                find_schedule_process(args, roster, schedule_q)
+                schedules.append(schedule_q.get())
+            records += [record for _, _, record in schedules]
 
-    if 1 < args.processes:
-        processes.clear()
-        for i in range(args.processes):
-            p = multiprocessing.Process(target=optimize_schedule_process, args=(args, families, schedule, schedule_q,))
-            processes.append(p)
-            p.start()
+            # find the best schedule from the processes, preferring ones that can seat everyone
+            schedule = unpack_schedule(max(schedules, key=lambda s: s[0])[1])
+
+        host_time = time.time()
+        args.deadline = start_time + args.time
         schedules.clear()
-        for p in processes:
+
+        if 1 < args.processes:
+            if None != shared:
+                shared = SharedBest(roster)
+            processes.clear()
+            for i in range(args.processes):
+                p = multiprocessing.Process(target=optimize_schedule_process, args=(args, roster, schedule, schedule_q, shared,))
+                processes.append(p)
+                p.start()
+            for p in processes:
+                schedules.append(schedule_q.get())
+            for p in processes:
+                p.join()
+        else:
+            optimize_schedule_process(args, roster, schedule, schedule_q)
             schedules.append(schedule_q.get())
-            p.join
-    else:
-        optimize_schedule_process(args, families, schedule, schedule_q)
-        schedules.append(schedule_q.get())
-
-    # find the best schedule from the threads
-    schedule = schedules[0]
-    current_score = score_guest(schedule)
-    for new_schedule in schedules:
-        new_score = score_guest(new_schedule)
-        if current_score < new_score:
-            schedule = new_schedule
-            current_score = new_score
-    
-    summery(schedule)
-    host_summery(schedule)
-         
-    log.warning("Total Possible Meals: " + str(count_meals(families)))
+        records += [record for _, _, record in schedules]
+        guest_time = time.time()
+
+        # find the best schedule from the processes
+        schedule = unpack_schedule(max(schedules, key=lambda s: s[0])[1])
+
+    # seat anyone the search left starved if the dinners can be shuffled to fit them
+    search = GuestSearch(roster, schedule)
+    repaired = search.repair()
+    if 0 < repaired:
+        log.warning("%d Family-meals seated by repair" % (repaired))
+    schedule = search.schedule
 
-    find_starved_family(families, schedule)
+    summery(roster, schedule)
+    host_summery(roster, schedule)
+
+    log.warning("Total Possible Meals: " + str(count_meals(families)))
 
-    write_csv(args.output, schedule)
+    find_starved_family(roster, schedule)
+
+    write_csv(args.output, expand_schedule(families, schedule))
+
+    # keep the schedule if it beats the cached one, seating more families and then by the combined
+    # score as the searches pick their best, the checkpoints are no longer needed
+    if None != args.cache:
+        scores = (host_objective(roster, schedule), guest_objective(roster, schedule))
+        rank = lambda s: (-starved_meals(roster, s), combined_score(roster, s, args.host_weight))
+        if None == cached or rank(cached[2]) < rank(schedule):
+            save_pickle(os.path.join(args.cache, args.cache_key + '.pickle'), scores + (schedule,))
+        for filename in glob.glob(os.path.join(args.cache, args.cache_key + '-*.pickle')):
+            os.remove(filename)
+
+    if None != args.metrics:
+        records.append({
+            'phase': 'total',
+            'worker': multiprocessing.current_process().name,
+            'processes': args.processes,
+            'families': roster.count,
+            'nights': roster.nights,
+            'seconds': round(time.time() - start_time, 6),
+            'score_host': score_host(roster, schedule),
+            'score_guest': score_guest(roster, schedule),
+            'timings': {'host': round(host_time - start_time, 6), 'guest': round(guest_time - host_time, 6),
+                        'finish': round(time.time() - guest_time, 6)},
+            })
+        write_metrics(args.metrics, records)
 
 if __name__ == "__main__":
     main()
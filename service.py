@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import argparse, hashlib, http.server, json, multiprocessing, os, threading, time, urllib.parse
+
+import schedule
+
+# Runs schedule.py as a local HTTP service so many what-if schedules can be made without starting
+# Python, forking workers and reading the input again for each one. Jobs are searched by a pool of
+# workers started once with the service, one job to a worker as schedule.py would with -p 1, and a
+# job for an input and options that are already queued, running or done is the same job (one that
+# failed is run again).
+#
+#   POST /jobs?time=30&max_dinner_size=8   with the input CSV as the body, the options are any of
+#                                          schedule.py's long options for its searches (not ones
+#                                          like --pipeline or --cache that only its main acts on,
+#                                          see main_only_options), gives the job
+#   GET /jobs                              every job
+#   GET /jobs/<id>                         a job's state, phase, best score so far and when done
+#                                          the scores and starved meals of its schedule
+#   GET /jobs/<id>/schedule                the schedule as CSV once the job is done
+
+# where the pool workers send their progress, set when each worker starts
+events = None
+
+def start_worker(queue):
+    global events
+    events = queue
+
+# searches a job in a pool worker, writing the schedule to output_file and returning how it did
+def run_job(job, args, input_file, output_file):
+    events.put((job, 'running', None))
+    families = schedule.read_csv(input_file, args.max_dinner_size)
+    roster = schedule.Roster(families)
+    result, _ = schedule.run_phases(args, roster, time.time(), args.time,
+                                    lambda phase, score: events.put((job, phase, score)))
+
+    # seat anyone the search left starved if the dinners can be shuffled to fit them
+    search = schedule.GuestSearch(roster, result)
+    search.repair()
+    schedule.write_csv(output_file, schedule.expand_schedule(families, search.schedule))
+    return {
+        'score_host': schedule.score_host(roster, search.schedule),
+        'score_guest': schedule.score_guest(roster, search.schedule),
+        'starved': schedule.starved_meals(roster, search.schedule),
+        }
+
+# The jobs of the service, keyed by a hash of their input and options. The HTTP threads submit and
+# look at jobs and a thread of its own takes in the progress the workers send.
+class Jobs:
+    def __init__(self, args):
+        self.directory = args.directory
+        self.default_time = args.time
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.events = multiprocessing.Queue()
+        self.pool = multiprocessing.Pool(args.processes, initializer=start_worker, initargs=(self.events,))
+        threading.Thread(target=self.drain, daemon=True).start()
+
+    # adds a job for the input with the options (a list of name, value pairs), returning the HTTP
+    # status and the job
+    def submit(self, body, options):
+        argv = ['--time', str(self.default_time)]
+        for name, value in options:
+            argv.append('--' + name)
+            if value:
+                argv.append(value)
+        parser = schedule.argument_parser()
+        try:
+            args = parser.parse_args(['input', 'output'] + argv)
+        except SystemExit:
+            return 400, {'error': 'bad options: %s' % ' '.join(argv)}
+        ignored = schedule.main_only_options(parser, args)
+        if parser.get_default('logLevel') != args.logLevel:
+            ignored.append('--log')
+        if ignored:
+            return 400, {'error': 'options the service can not act on: %s' % ' '.join(ignored)}
+
+        # the job is named for the input and the settings the options come to, so the same options
+        # given in another order or left at their defaults are the same job
+        settings = sorted((name, value) for name, value in vars(args).items() if name not in ('input', 'output'))
+        job = hashlib.sha256(body + b'\0' + json.dumps(settings).encode()).hexdigest()[:16]
+        args.input = os.path.join(self.directory, job + '-in.csv')
+        args.output = os.path.join(self.directory, job + '-out.csv')
+
+        with self.lock:
+            if job in self.jobs and 'failed' != self.jobs[job]['state']:
+                return 200, dict(self.jobs[job])
+            with open(args.input, 'wb') as file:
+                file.write(body)
+            self.jobs[job] = {'id': job, 'state': 'queued', 'phase': None, 'score': None,
+                              'submitted': time.time(), 'options': argv}
+            self.pool.apply_async(run_job, (job, args, args.input, args.output),
+                                  callback=lambda result: self.finish(job, 'done', result),
+                                  error_callback=lambda error: self.finish(job, 'failed', {'error': repr(error)}))
+            return 201, dict(self.jobs[job])
+
+    # records a job that has finished
+    def finish(self, job, state, result):
+        with self.lock:
+            self.jobs[job].update(result, state=state, finished=time.time())
+
+    # takes in the progress from the workers for as long as the service runs
+    def drain(self):
+        while True:
+            job, phase, score = self.events.get()
+            with self.lock:
+                record = self.jobs[job]
+                if 'running' == phase:
+                    if 'queued' == record['state']:
+                        record.update(state='running', started=time.time())
+                elif 'running' == record['state']:
+                    record.update(phase=phase, score=score)
+
+    # a copy of a job, or None if there is no such job
+    def get(self, job):
+        with self.lock:
+            return dict(self.jobs[job]) if job in self.jobs else None
+
+    # copies of every job
+    def all(self):
+        with self.lock:
+            return [dict(record) for record in self.jobs.values()]
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def reply(self, status, body, content_type='application/json'):
+        if 'application/json' == content_type:
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if '/jobs' != url.path.rstrip('/'):
+            return self.reply(404, {'error': 'not found'})
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status, record = self.server.jobs.submit(body, urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        self.reply(status, record)
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path).path.strip('/').split('/')
+        jobs = self.server.jobs
+        if ['jobs'] == parts:
+            return self.reply(200, jobs.all())
+        if 2 <= len(parts) <= 3 and 'jobs' == parts[0]:
+            record = jobs.get(parts[1])
+            if None == record:
+                return self.reply(404, {'error': 'no such job'})
+            if 2 == len(parts):
+                return self.reply(200, record)
+            if 'schedule' == parts[2]:
+                if 'done' != record['state']:
+                    return self.reply(409, {'error': 'job is %s' % record['state']})
+                with open(os.path.join(jobs.directory, parts[1] + '-out.csv'), 'rb') as file:
+                    return self.reply(200, file.read(), 'text/csv')
+        self.reply(404, {'error': 'not found'})
+
+    # requests are logged with the searches' logging rather than to stderr one line each
+    def log_message(self, format, *arguments):
+        multiprocessing.get_logger().info(format % arguments)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Serves Salt shaker dinner schedules over HTTP on this machine'
+            )
+    parser.add_argument("--host", default='127.0.0.1', help="The address to listen on")
+    parser.add_argument("--port", default=8765, type=int, help="The port to listen on")
+    parser.add_argument("-p", "--processes", type=int, help="The jobs to search at once, all cpus by default")
+    parser.add_argument("-t", "--time", default=30, type=float, help="The seconds to search a job for when it doesn't say")
+    parser.add_argument("-d", "--directory", default='jobs', help="Where to keep the inputs and schedules of the jobs")
+    parser.add_argument("-l", "--log", dest="logLevel", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help="Set the logging level", default='WARNING')
+    args = parser.parse_args()
+
+    multiprocessing.log_to_stderr(level=getattr(schedule.logging, args.logLevel))
+    os.makedirs(args.directory, exist_ok=True)
+
+    server = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    server.jobs = Jobs(args)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.jobs.pool.terminate()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
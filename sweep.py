@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import argparse, copy, csv, multiprocessing, os, sys, time
+
+import schedule
+
+# Schedules one input with every combination of a few settings, to compare them when planning a
+# season. The input is read once and the rosters share everything that doesn't change between the
+# settings (see Roster), then the configurations are searched in parallel, each in one process as
+# schedule.py would with -p 1, and each schedule is written to its own file.
+
+COLUMNS = ['max_dinner_size', 'host_target', 'score_host', 'score_guest', 'starved', 'host_ratio_spread',
+           'output']
+
+# the families as they are with the setting of a configuration, where host_target None keeps the
+# targets from the input and a number is the target of every host without one
+def configure(families, max_dinner_size, host_target):
+    configured = []
+    for family in families:
+        family = copy.copy(family)
+        family.space = min(family.space, max_dinner_size)
+        if None != host_target and None == family.host_target and any(family.host_nights):
+            family.host_target = host_target
+        configured.append(family)
+    return configured
+
+# the difference between the biggest and smallest host ratio of the hosts without a target
+def host_ratio_spread(roster, schedule):
+    host_counts = {}
+    for hosts in schedule:
+        for host in hosts:
+            if None == roster.host_target[host]:
+                host_counts[host] = host_counts.get(host, 0) + 1
+    ratios = [count/roster.nights_count[host] for host, count in host_counts.items()]
+    return max(ratios) - min(ratios) if ratios else 0
+
+# searches one configuration in a pool worker, sending back the schedule packed
+def run_configuration(args, roster):
+    result, _ = schedule.run_phases(args, roster, time.time(), args.time)
+
+    # seat anyone the search left starved if the dinners can be shuffled to fit them
+    search = schedule.GuestSearch(roster, result)
+    search.repair()
+    return schedule.pack_schedule(search.schedule)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Schedules Salt shaker dinners with every combination of some settings and compares them',
+            epilog="Arguments after -- are passed on to schedule.py's searches, which run in one process "
+                   "each so options like --pipeline, --partitions, --previous or --cache are turned down"
+            )
+    parser.add_argument("input")
+    parser.add_argument("output", help="The start of each configuration's schedule file, which ends _<size>_<target>.csv")
+    parser.add_argument("--max_dinner_sizes", default=[8], type=int, nargs='+',
+                        help="The --max_dinner_size of each configuration")
+    parser.add_argument("--host_targets", default=['input'], nargs='+',
+                        help="The host targets of each configuration, 'input' for the ones in the input or a "
+                             "number for every host without one")
+    parser.add_argument("-p", "--processes", type=int, help="The configurations to search at once, all cpus by default")
+    parser.add_argument("-t", "--time", default=30, type=float, help="The seconds to search each configuration for")
+    parser.add_argument("-o", "--table", help="Also write the comparison to this CSV")
+    # the arguments after -- are split off first as they would otherwise be taken for the outputs
+    argv = sys.argv[1:]
+    schedule_argv = []
+    if '--' in argv:
+        schedule_argv = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+    targets = [None if 'input' == target else int(target) for target in args.host_targets]
+
+    # the searches take schedule.py's settings, other than the ones each search in a single process
+    # can't act on and the ones the sweep sets itself
+    schedule_parser = schedule.argument_parser()
+    schedule_args = schedule_parser.parse_args([args.input, args.output] + schedule_argv)
+    ignored = schedule.main_only_options(schedule_parser, schedule_args)
+    ignored += ['--' + name for name in ['time', 'max_dinner_size']
+                if schedule_parser.get_default(name) != getattr(schedule_args, name)]
+    if ignored:
+        parser.error('%s can not be passed on to schedule.py by a sweep' % ', '.join(ignored))
+    schedule_args.time = args.time
+    multiprocessing.log_to_stderr(level=getattr(schedule.logging, schedule_args.logLevel))
+
+    # read the input once, with the biggest dinners any configuration allows
+    families = schedule.read_csv(args.input, sys.maxsize)
+    base = schedule.Roster(families)
+    configurations = []
+    for max_dinner_size in args.max_dinner_sizes:
+        for host_target in targets:
+            roster = schedule.Roster(configure(families, max_dinner_size, host_target), base)
+            output = '%s_%d_%s.csv' % (args.output, max_dinner_size, 'input' if None == host_target else host_target)
+            configurations.append((max_dinner_size, host_target, roster, output))
+
+    with multiprocessing.Pool(args.processes or os.cpu_count()) as pool:
+        results = pool.starmap(run_configuration, [(schedule_args, roster) for _, _, roster, _ in configurations])
+
+    rows = []
+    print(' '.join(COLUMNS))
+    for (max_dinner_size, host_target, roster, output), packed in zip(configurations, results):
+        result = schedule.unpack_schedule(packed)
+        schedule.write_csv(output, schedule.expand_schedule(roster.families, result))
+        row = {
+            'max_dinner_size': max_dinner_size,
+            'host_target': 'input' if None == host_target else host_target,
+            'score_host': round(schedule.score_host(roster, result), 3),
+            'score_guest': round(schedule.score_guest(roster, result), 3),
+            'starved': schedule.starved_meals(roster, result),
+            'host_ratio_spread': round(host_ratio_spread(roster, result), 3),
+            'output': output,
+            }
+        rows.append(row)
+        print(' '.join(str(row[column]) for column in COLUMNS), flush=True)
+
+    if None != args.table:
+        with open(args.table, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import glob, os, random, unittest
+
+import schedule
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+
+# Checks the two forms of score_guest agree, to the last bit, on schedules filled from the examples and
+# on the example outputs.
+class TestScoreGuestMatrix(unittest.TestCase):
+    def test_filled_schedules(self):
+        random.seed(0)
+        for filename in sorted(glob.glob(os.path.join(EXAMPLES, 'in', '*.csv'))):
+            roster = schedule.Roster(schedule.read_csv(filename, 8))
+            for _ in range(5):
+                host_schedule = schedule.generate_host_schedule(roster)
+                search = schedule.GuestSearch(roster, schedule.fill_schedule(roster, host_schedule))
+                search.repair()
+                for _ in range(1000):
+                    search.step()
+                with self.subTest(input=os.path.basename(filename)):
+                    self.assertEqual(schedule.score_guest_matrix(roster, search.schedule),
+                                     schedule.score_guest(roster, search.schedule))
+
+    def test_example_outputs(self):
+        for filename in sorted(glob.glob(os.path.join(EXAMPLES, 'out', '*_out.csv'))):
+            name = os.path.basename(filename)[:-len('_out.csv')]
+            roster = schedule.Roster(schedule.read_csv(os.path.join(EXAMPLES, 'in', name + '_in.csv'), 8))
+            result = schedule.read_schedule(filename, roster)
+            with self.subTest(output=name):
+                self.assertEqual(schedule.score_guest_matrix(roster, result), schedule.score_guest(roster, result))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# This file is part of saltshaker.
+#
+# saltshaker is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# saltshaker is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with saltshaker. If not,
+# see <https://www.gnu.org/licenses/>.
+
+
+import argparse, csv, http.server, io, json, os, tempfile, threading, time, unittest, urllib.error, urllib.request
+
+import schedule
+import service
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', 'in', 'a2_in.csv')
+
+# Runs the service on a free port of localhost with one worker and short jobs, and goes through a
+# job the way a client would: submit it, submit it again, poll it till it is done and fetch the
+# schedule.
+class TestService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        args = argparse.Namespace(directory=cls.directory.name, time=1, processes=1)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), service.Handler)
+        cls.server.jobs = service.Jobs(args)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        with open(EXAMPLE, 'rb') as file:
+            cls.body = file.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.jobs.pool.terminate()
+        cls.server.server_close()
+        cls.directory.cleanup()
+
+    # the status and body of a request to the service
+    def request(self, path, body=None):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url + path, data=body)) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+    # polls a job till it is done (or failed), returning its record
+    def wait(self, job):
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            status, body = self.request('/jobs/' + job)
+            self.assertEqual(200, status)
+            record = json.loads(body)
+            if record['state'] in ('done', 'failed'):
+                return record
+            time.sleep(0.1)
+        self.fail('job %s did not finish' % job)
+
+    def test_job(self):
+        status, body = self.request('/jobs?max_dinner_size=8', self.body)
+        self.assertEqual(201, status)
+        job = json.loads(body)['id']
+
+        # the same input and settings are the same job, however the options are given
+        for query in ('max_dinner_size=8', '', 'time=1&max_dinner_size=8', 'max_dinner_size=8&time=1'):
+            with self.subTest(query=query):
+                status, body = self.request('/jobs?' + query, self.body)
+                self.assertEqual(200, status)
+                self.assertEqual(job, json.loads(body)['id'])
+        status, body = self.request('/jobs?max_dinner_size=6', self.body)
+        self.assertEqual(201, status)
+        self.assertNotEqual(job, json.loads(body)['id'])
+
+        record = self.wait(job)
+        self.assertEqual('done', record['state'], record.get('error'))
+        self.assertIn('starved', record)
+        self.assertIn(job, [r['id'] for r in json.loads(self.request('/jobs')[1])])
+
+        status, body = self.request('/jobs/%s/schedule' % job)
+        self.assertEqual(200, status)
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(['Night', 'Size', 'Space', 'Host', 'Attendees'], rows[0])
+        roster = schedule.Roster(schedule.read_csv(EXAMPLE, 8))
+        self.assertEqual(roster.nights, len({row[0] for row in rows[1:]}))
+
+    def test_joint_job(self):
+        status, body = self.request('/jobs?joint=', self.body)
+        self.assertEqual(201, status)
+        record = self.wait(json.loads(body)['id'])
+        self.assertEqual('done', record['state'], record.get('error'))
+
+    def test_options_turned_down(self):
+        for query in ('pipeline=', 'partitions=2', 'previous=out.csv', 'cache=cache', 'processes=4', 'nonsense=1'):
+            with self.subTest(query=query):
+                self.assertEqual(400, self.request('/jobs?' + query, self.body)[0])
+
+    def test_not_found(self):
+        self.assertEqual(404, self.request('/jobs/nope')[0])
+        self.assertEqual(404, self.request('/other')[0])
+
+if __name__ == "__main__":
+    unittest.main()